@@ -0,0 +1,145 @@
+# Batched static evaluation with NumPy
+#
+# Scores a whole stack of positions in one call. Positions are given as an
+# (N, H, W) int8 array (0 for an empty slot, 1 for 'X', 2 for 'O'). All the
+# lines of all the boards are gathered into one array and every pattern of
+# evaluation.PATTERN_GROUPS is matched along them with sliding windows. The
+# lines scoring each weight are counted, so the scores, products of these
+# counts with the weights, are the same as AIPlayer.static_eval's; the
+# counts themselves are the features tune.py fits the weights on.
+#
+# Usage: python batch_eval.py --verify [N]   compares the batched scores of N
+#                                            random positions to static_eval
+import functools
+import sys
+import numpy as np
+
+from evaluation import board_lines, PATTERN_GROUPS, THREAT, WEIGHT_INDEX, WEIGHT_NAMES, weights_vector
+
+CODES = {' ': 0, 'X': 1, 'O': 2}
+# cell value used to pad the lines to the same length, matched by no pattern
+PAD = 3
+# number of boards scored at a time, to bound the memory used
+CHUNK = 4096
+
+
+def boards_to_array(boards):
+    """ returns the positions of a list of Board objects of the same size as
+        an (N, H, W) int8 array.
+    """
+    return np.array([[[CODES[ch] for ch in row] for row in board.slots]
+                     for board in boards], dtype=np.int8)
+
+
+@functools.lru_cache(maxsize=None)
+def _line_index(height, width):
+    """ returns the (lines, length) array of the flat cell indices of the
+        lines of board_lines, padded with the index height*width.
+    """
+    lines = board_lines(height, width)
+    length = max(len(line) for line in lines)
+    index = np.full((len(lines), length), height * width, dtype=np.intp)
+    for idx, line in enumerate(lines):
+        index[idx, :len(line)] = [row * width + col for row, col in line]
+    return index
+
+
+def _find(lines, template):
+    """ returns a (N, lines) boolean array telling which lines contain
+        template, a pattern of PATTERN_GROUPS, in relative codes.
+    """
+    codes = [{' ': 0, 'm': 1, 'o': 2}[ch] for ch in template]
+    windows = lines.shape[2] - len(codes) + 1
+    if windows <= 0:
+        return np.zeros(lines.shape[:2], dtype=bool)
+    found = lines[:, :, 0:windows] == codes[0]
+    for j in range(1, len(codes)):
+        found &= lines[:, :, j:j + windows] == codes[j]
+    return found.any(axis=2)
+
+
+def _count_patterns(lines):
+    """ returns the (N, len(WEIGHT_NAMES)) counts of the lines of every
+        board, given in relative codes, that score each weight.
+    """
+    counts = np.zeros((lines.shape[0], len(WEIGHT_NAMES)), dtype=np.int64)
+    for group_idx, group in enumerate(PATTERN_GROUPS):
+        # going backwards, so that the first pattern found has the last word
+        first = np.full(lines.shape[:2], -1, dtype=np.int8)
+        for t in reversed(range(len(group))):
+            first[_find(lines, group[t][0])] = t
+        for t, (template, name) in enumerate(group):
+            if name is not THREAT:
+                counts[:, WEIGHT_INDEX[name]] += (first == t).sum(axis=1)
+        if group_idx == 1:
+            threat = np.isin(first, [t for t, (template, name) in enumerate(group)
+                                     if name is THREAT])
+        if group_idx == 2:
+            counts[:, WEIGHT_INDEX['threat_penalty']] += ((first < 0) & threat).sum(axis=1)
+    return counts
+
+
+def pattern_counts(boards, checker):
+    """ returns how many times every pattern of WEIGHT_NAMES occurs in each
+        position of boards, an (N, H, W) array of cell codes, from the point
+        of view of checker ('X' or 'O'), as an (N, len(WEIGHT_NAMES)) array.
+        The static evaluation of a position is its row of counts times the
+        weights vector.
+    """
+    boards = np.asarray(boards, dtype=np.int8)
+    n, height, width = boards.shape
+    me = CODES[checker]
+    opp = 3 - me
+    index = _line_index(height, width)
+    counts = np.zeros((n, len(WEIGHT_NAMES)), dtype=np.int64)
+    for start in range(0, n, CHUNK):
+        chunk = boards[start:start + CHUNK].reshape(-1, height * width)
+        chunk = np.concatenate([chunk, np.full((len(chunk), 1), PAD, dtype=np.int8)], axis=1)
+        # relative codes: 1 for checker, 2 for the opponent
+        rel = np.where(chunk == me, 1, np.where(chunk == opp, 2, chunk)).astype(np.int8)
+        counts[start:start + CHUNK] = _count_patterns(rel[:, index])
+    return counts
+
+
+def evaluate_batch(boards, checker, weights=None):
+    """ returns the static evaluation of every position of boards, an
+        (N, H, W) array of cell codes, from the point of view of checker
+        ('X' or 'O') and with weights (the default ones if None), as an
+        array of N integers.
+    """
+    return pattern_counts(boards, checker) @ np.array(weights_vector(weights), dtype=np.int64)
+
+
+def _verify(count):
+    """ compares evaluate_batch to AIPlayer.static_eval on count random
+        positions and returns the number of mismatches.
+    """
+    import random
+    from gomoku import Board
+    from main import AIPlayer
+    rng = random.Random(0)
+    boards = []
+    for i in range(count):
+        board = Board(10, 10)
+        for k in range(rng.randrange(60)):
+            board.add_checker(rng.choice('XO'), rng.randrange(10), rng.randrange(10))
+        boards.append(board)
+    array = boards_to_array(boards)
+    errors = 0
+    for checker, opp_checker in (('X', 'O'), ('O', 'X')):
+        scores = evaluate_batch(array, checker)
+        for board, score in zip(boards, scores):
+            if AIPlayer.static_eval(board, checker, opp_checker) != score:
+                errors += 1
+    return errors
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--verify':
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+        errors = _verify(count)
+        print(count, 'positions checked,', errors, 'mismatches')
+        if errors:
+            sys.exit(1)
+    else:
+        print('usage: python batch_eval.py --verify [N]')
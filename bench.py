@@ -0,0 +1,240 @@
+# Benchmarks of the AI player on fixed positions
+#
+# Runs the engine on a fixed set of positions (openings, middle games, forced
+# wins and forced defences) and reports:
+#   - for every position, the move of AIPlayer.next_move, whether it is one
+#     of the expected moves, the time taken to settle on it and the nodes
+#     searched per second,
+#   - the nodes of a minimax search to a fixed depth, which are the same on
+#     every machine, so that a change of move ordering or pruning shows at
+#     once, and the nodes it searches per second,
+#   - the number of static_eval calls per second.
+# Every player is seeded, so two runs of the same engine search the same
+# trees. A run can be saved as a baseline and the next ones compared to it:
+# the comparison fails if a position is no longer solved, if a fixed-depth
+# search needs more nodes or if a speed drops by more than the tolerance.
+# Speeds depend on the machine, so baselines are not portable.
+#
+# Usage: python bench.py [--time-limit S] [--depth N] [--repeat N]
+#                        [--save-baseline FILE] [--baseline FILE]
+#                        [--tolerance F] [--board list|bit]
+import argparse
+import json
+import sys
+import time
+
+from bitboard import BOARDS
+from gomoku import Board
+from main import AIPlayer
+
+# name, kind, board size, moves played so far ('row,col', 'X' first) and the
+# moves accepted as correct (None when any move is)
+POSITIONS = [
+    ('empty-10', 'opening', 10, '', None),
+    ('reply-10', 'opening', 10, '4,4', None),
+    ('reply-15', 'opening', 15, '7,7', None),
+    ('empty-19', 'opening', 19, '', None),
+    ('middle-10', 'middle', 10,
+     '3,3 4,4 3,4 3,5 4,3 5,3 6,2 2,6 1,7 2,4 2,5 5,2 1,6 0,7 5,4 4,6 1,3 5,7 '
+     '6,8 3,6', None),
+    ('middle-19', 'middle', 19,
+     '8,8 9,9 8,9 8,10 9,8 10,8 11,7 7,11 6,12 7,9 7,10 10,7 6,11 5,12 10,9 '
+     '9,11 6,8 10,12 11,13 8,11', None),
+    ('defend-four-10', 'defence', 10, '3,3 4,4 3,4 3,5 4,3 5,3 6,2 2,6',
+     [(1, 7)]),
+    ('defend-three-10', 'defence', 10,
+     '3,3 4,4 3,4 3,5 4,3 5,3 6,2 2,6 1,7 2,4 2,5', [(1, 6), (5, 2)]),
+    ('defend-middle-10', 'defence', 10,
+     '3,3 4,4 3,4 3,5 4,3 5,3 6,2 2,6 1,7 2,4 2,5 5,2 1,6 0,7 5,4 4,6',
+     [(1, 3), (5, 7)]),
+    ('defend-late-10', 'defence', 10,
+     '3,3 4,4 3,4 3,5 4,3 5,3 6,2 2,6 1,7 2,4 2,5 5,2 1,6 0,7 5,4 4,6 1,3 5,7 '
+     '6,8 3,6 1,5 1,4 2,3 0,3 1,8 1,9 6,6 4,5 4,7 5,5 6,5', [(2, 8), (3, 7)]),
+    ('win-10', 'win', 10,
+     '3,3 4,4 3,4 3,5 4,3 5,3 6,2 2,6 1,7 2,4 2,5 5,2 1,6 0,7 5,4 4,6 1,3 5,7 '
+     '6,8 3,6 1,5 1,4 2,3 0,3 1,8 1,9 6,6 4,5 4,7 5,5 6,5 6,4',
+     [(3, 2), (6, 7), (6, 9), (7, 6)]),
+    ('defend-four-15', 'defence', 15, '5,5 6,6 5,6 5,7 4,6 4,8 7,5 3,9',
+     [(2, 10)]),
+    ('defend-three-15', 'defence', 15,
+     '5,5 6,6 5,6 5,7 4,6 4,8 7,5 3,9 2,10 6,5 6,4', [(3, 7), (7, 3)]),
+]
+
+
+def build_board(size, moves, board_class=Board):
+    """ returns the board_class board of the given size after moves, a
+        string of 'row,col' separated by spaces played alternately by 'X'
+        and 'O', and the checker to move.
+    """
+    board = board_class(size, size)
+    checker = 'X'
+    for move in moves.split():
+        row, col = move.split(',')
+        board.add_checker(checker, int(row), int(col))
+        checker = 'O' if checker == 'X' else 'X'
+    return board, checker
+
+
+def _player(board, checker, **options):
+    """ returns a seeded AIPlayer collecting stats, as if it had played the
+        checkers of board.
+    """
+    player = AIPlayer(checker, seed=0, stats=True, **options)
+    player.num_moves = sum(1 for ch, row, col in board.history if ch == checker)
+    return player
+
+
+def bench_move(position, time_limit, board_class=Board):
+    """ plays the next move of position with a time limit and returns its
+        results: the move, whether it is correct (None when there is no
+        expected move), the seconds taken, the seconds after which the
+        iterative deepening had settled on it, and the node counts.
+    """
+    name, kind, size, moves, expected = position
+    board, checker = build_board(size, moves, board_class)
+    player = _player(board, checker, time_limit=time_limit)
+    start = time.perf_counter()
+    move = player.next_move(board)
+    seconds = time.perf_counter() - start
+    stats = player.last_stats
+    player.close()
+    solved = None if expected is None else move in expected
+    time_to_solve = None
+    if solved:
+        time_to_solve = seconds
+        for record in reversed(stats.depths):
+            if record['move'] not in expected:
+                break
+            time_to_solve = record['seconds']
+    return {'move': list(move), 'solved': solved, 'seconds': seconds,
+            'time_to_solve': time_to_solve, 'nodes': stats.nodes,
+            'evals': stats.evals,
+            'nps': stats.nodes / seconds if seconds > 0 else 0.0}
+
+
+def bench_search(position, depth, board_class=Board):
+    """ searches position to the given depth without a time limit nor the
+        threat search and returns the nodes and the seconds it took.
+    """
+    name, kind, size, moves, expected = position
+    board, checker = build_board(size, moves, board_class)
+    player = _player(board, checker, time_limit=float('inf'), max_depth=depth,
+                     threat_depth=0)
+    start = time.perf_counter()
+    player.next_move(board)
+    seconds = time.perf_counter() - start
+    player.close()
+    return {'nodes': player.last_stats.nodes, 'seconds': seconds}
+
+
+def bench_eval(positions, repeat):
+    """ returns the number of AIPlayer.static_eval calls per second on the
+        boards of positions.
+    """
+    boards = [build_board(size, moves)[0]
+              for name, kind, size, moves, expected in positions]
+    calls = 0
+    start = time.perf_counter()
+    for i in range(repeat):
+        for board in boards:
+            AIPlayer.static_eval(board, 'X', 'O')
+            AIPlayer.static_eval(board, 'O', 'X')
+            calls += 2
+    return calls / (time.perf_counter() - start)
+
+
+def run_bench(time_limit=1.0, depth=3, repeat=200, positions=POSITIONS, board_class=Board):
+    """ runs the whole benchmark on board_class boards and returns its
+        results as a dictionary, ready to be saved as JSON.
+    """
+    results = {'time_limit': time_limit, 'depth': depth,
+               'moves': {}, 'searches': {}}
+    for position in positions:
+        results['moves'][position[0]] = bench_move(position, time_limit, board_class)
+        results['searches'][position[0]] = bench_search(position, depth, board_class)
+    puzzles = [r for r in results['moves'].values() if r['solved'] is not None]
+    results['solved'] = sum(1 for r in puzzles if r['solved'])
+    results['puzzles'] = len(puzzles)
+    nodes = sum(r['nodes'] for r in results['moves'].values())
+    seconds = sum(r['seconds'] for r in results['moves'].values())
+    results['move_nps'] = nodes / seconds if seconds > 0 else 0.0
+    nodes = sum(r['nodes'] for r in results['searches'].values())
+    seconds = sum(r['seconds'] for r in results['searches'].values())
+    results['search_nodes'] = nodes
+    results['search_nps'] = nodes / seconds if seconds > 0 else 0.0
+    results['evals_per_second'] = bench_eval(positions, repeat)
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """ returns the list of regressions of results against baseline: lost
+        puzzles, fixed-depth searches needing more nodes and speeds dropping
+        by more than tolerance (a fraction).
+    """
+    regressions = []
+    for name, old in baseline['moves'].items():
+        new = results['moves'].get(name)
+        if new is not None and old['solved'] and not new['solved']:
+            regressions.append('%s: not solved any more (played %s)' % (name, new['move']))
+    if results['depth'] == baseline['depth']:
+        for name, old in baseline['searches'].items():
+            new = results['searches'].get(name)
+            if new is not None and new['nodes'] > old['nodes'] * (1 + tolerance):
+                regressions.append('%s: %d nodes at depth %d instead of %d' %
+                                   (name, new['nodes'], results['depth'], old['nodes']))
+    for key in ('move_nps', 'search_nps', 'evals_per_second'):
+        if results[key] < baseline[key] * (1 - tolerance):
+            regressions.append('%s: %.0f instead of %.0f' % (key, results[key], baseline[key]))
+    return regressions
+
+
+def print_results(results):
+    print('%-18s %-8s %-8s %-7s %8s %8s %9s %10s' %
+          ('position', 'move', 'correct', 'time', 'solved', 'nodes', 'nodes/s',
+           'depth %d' % results['depth']))
+    for name, kind, size, moves, expected in POSITIONS:
+        if name not in results['moves']:
+            continue
+        move = results['moves'][name]
+        solved = {None: '-', True: 'yes', False: 'NO'}[move['solved']]
+        to_solve = '-' if move['time_to_solve'] is None else '%.3f' % move['time_to_solve']
+        print('%-18s %-8s %-8s %-7.3f %8s %8d %9.0f %10d' %
+              (name, '%d,%d' % tuple(move['move']), solved, move['seconds'],
+               to_solve, move['nodes'], move['nps'], results['searches'][name]['nodes']))
+    print('solved %d/%d puzzles' % (results['solved'], results['puzzles']))
+    print('nodes/s: %.0f (timed moves), %.0f (fixed depth, %d nodes)' %
+          (results['move_nps'], results['search_nps'], results['search_nodes']))
+    print('static_eval calls/s: %.0f' % results['evals_per_second'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Gomoku engine.')
+    parser.add_argument('--time-limit', type=float, default=1.0)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--baseline', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--board', choices=sorted(BOARDS), default='list',
+                        help='board backend (default: list)')
+    args = parser.parse_args()
+
+    results = run_bench(args.time_limit, args.depth, args.repeat, board_class=BOARDS[args.board])
+    print_results(results)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=1)
+        print('baseline saved to', args.save_baseline)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION', regression)
+        if regressions:
+            sys.exit(1)
+        print('no regression against', args.baseline)
+
+
+if __name__ == '__main__':
+    main()
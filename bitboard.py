@@ -0,0 +1,95 @@
+# The script provides a bitboard-backed Gomoku Board
+#
+# Every colour is kept as one Python integer, one bit per cell. Rows are
+# padded with an always-empty column so that shifting a mask along a row or
+# a diagonal never wraps into the next row.
+from gomoku import Board
+
+
+class BitBoard(Board):
+    """ a Board that keeps one integer bitmask per checker. It offers the
+        same can_add_to/add_checker/is_win_for/is_full/__repr__ interface
+        as Board, and still mirrors the position in slots so that code
+        reading the slots directly (e.g. AIPlayer.static_eval) is unchanged.
+    """
+
+    def __init__(self, height=10, width=10, radius=1):
+        self.stride = width + 1
+        # shifts to the right, down, down-right and down-left neighbour
+        self.shifts = (1, self.stride, self.stride + 1, self.stride - 1)
+        self.full_mask = 0
+        for row in range(height):
+            self.full_mask |= ((1 << width) - 1) << (row * self.stride)
+        Board.__init__(self, height, width, radius)
+        self.bits = {'X': 0, 'O': 0}
+
+    @classmethod
+    def from_board(cls, board):
+        """ returns a BitBoard holding the same position as board.
+        """
+        new_board = cls(board.height, board.width, board.radius)
+        for checker, row, col in board.history:
+            new_board.add_checker(checker, row, col)
+        return new_board
+
+    def reset(self):
+        Board.reset(self)
+        self.bits = {'X': 0, 'O': 0}
+
+    def can_add_to(self, row, col):
+        """ returns True if you can add a checker to the specified position
+            (row, col) in the called Board object, and False otherwise.
+            input: row, col are integers
+        """
+        if col < 0 or col >= self.width \
+            or row < 0 or row >= self.height:
+            return False
+        bit = 1 << (row * self.stride + col)
+        return not (self.bits['X'] | self.bits['O']) & bit
+
+    def add_checker(self, checker, row, col):
+        """ adds the specified checker (either 'X' or 'O') to the
+            position (row, col) of the called Board.
+        """
+        assert(checker == 'X' or checker == 'O')
+
+        if self.can_add_to(row, col):
+            Board.add_checker(self, checker, row, col)
+            self.bits[checker] |= 1 << (row * self.stride + col)
+
+    def remove_checker(self, row, col):
+        """ removes the checker at position (row, col) from the called
+            Board, leaving the slot empty.
+        """
+        self.bits[self.slots[row][col]] &= ~(1 << (row * self.stride + col))
+        Board.remove_checker(self, row, col)
+
+    def is_full(self):
+        return self.bits['X'] | self.bits['O'] == self.full_mask
+
+    def is_win_for(self, checker, r, c):
+        """ Checks for if the specified checker added to position r, c
+            completes a line of five (or more) through that position
+        """
+        assert(checker == 'X' or checker == 'O')
+        m = self.bits[checker]
+        idx = r * self.stride + c
+        for s in self.shifts:
+            # bit i of five is set when cells i, i+s, ..., i+4s are all taken
+            two = m & (m >> s)
+            five = two & (two >> 2*s) & (m >> 4*s)
+            if not five:
+                continue
+            # a five covers (r, c) if it starts at most four steps before it
+            for k in range(5):
+                start = idx - k*s
+                if start < 0:
+                    break
+                if five >> start & 1:
+                    return True
+        return False
+
+
+# the board backends, by name, for the command line options of match.py,
+# bench.py and run.py
+BOARDS = {'list': Board, 'bit': BitBoard}
@@ -0,0 +1,222 @@
+# Opening book for the AI player
+#
+# The book maps positions to the move the engine found best there after a
+# long search. Positions are identified by their Zobrist key, taken under the
+# 8 symmetries of a square board (4 for a rectangle): the smallest of the
+# keys is the canonical key, and the move is stored in the orientation that
+# gives it, so one entry covers every mirror image of a position.
+#
+# File format (little endian): a header '<4sHHHI' (BOOK_MAGIC, BOOK_VERSION,
+# height, width, number of entries) followed by the entries '<QH' (canonical
+# key, row * width + col of the move), sorted by key. At runtime the file is
+# mapped in memory and searched by bisection, so opening it is immediate and
+# does not load it on the heap.
+#
+# Usage: python book.py build FILE [--size N] [--plies N] [--branching N]
+#                                  [--time-limit S] [--workers N]
+#        python book.py info FILE
+import argparse
+import mmap
+import multiprocessing
+import struct
+
+from gomoku import Board, zobrist_keys
+
+BOOK_MAGIC = b'GMKB'
+BOOK_VERSION = 1
+HEADER = struct.Struct('<4sHHHI')
+ENTRY = struct.Struct('<QH')
+
+
+def symmetries(height, width):
+    """ returns the symmetries of a board of the given size, as functions
+        of (row, col) returning the image cell.
+    """
+    transforms = [
+        lambda r, c: (r, c),
+        lambda r, c: (r, width - 1 - c),
+        lambda r, c: (height - 1 - r, c),
+        lambda r, c: (height - 1 - r, width - 1 - c),
+    ]
+    if height == width:
+        n = height
+        transforms += [
+            lambda r, c: (c, r),
+            lambda r, c: (c, n - 1 - r),
+            lambda r, c: (n - 1 - c, r),
+            lambda r, c: (n - 1 - c, n - 1 - r),
+        ]
+    return transforms
+
+
+# index of the inverse of every symmetry of symmetries()
+INVERSE = [0, 1, 2, 3, 4, 6, 5, 7]
+
+
+def canonical_key(board):
+    """ returns the canonical key of the position of board and the index of
+        the symmetry that maps the position to its canonical orientation.
+    """
+    keys = zobrist_keys(board.height, board.width)
+    best = None
+    for idx, transform in enumerate(symmetries(board.height, board.width)):
+        key = 0
+        for checker, row, col in board.history:
+            r, c = transform(row, col)
+            key ^= keys[checker][r][c]
+        if best is None or key < best[0]:
+            best = (key, idx)
+    return best
+
+
+class OpeningBook:
+    """ an opening book file, mapped in memory. lookup(board) returns the
+    book move for the position of board, or None.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.height, self.width, self.count = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise ValueError('%s is not an opening book' % path)
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key):
+        """ returns the move index stored for the canonical key, or None.
+        """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_key, move = ENTRY.unpack_from(self.data, HEADER.size + mid * ENTRY.size)
+            if entry_key < key:
+                lo = mid + 1
+            elif entry_key > key:
+                hi = mid
+            else:
+                return move
+        return None
+
+    def lookup(self, board):
+        """ returns the book move (row, col) for the position of board, or
+            None if the position is not in the book.
+        """
+        if board.height != self.height or board.width != self.width:
+            return None
+        key, idx = canonical_key(board)
+        move = self.find(key)
+        if move is None:
+            return None
+        row, col = divmod(move, self.width)
+        row, col = symmetries(self.height, self.width)[INVERSE[idx]](row, col)
+        if not board.can_add_to(row, col):
+            return None
+        return row, col
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def write_book(path, height, width, entries):
+    """ writes entries, a dictionary {canonical key: (row, col)} of moves in
+        the canonical orientation, as a book file.
+    """
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(BOOK_MAGIC, BOOK_VERSION, height, width, len(entries)))
+        for key in sorted(entries):
+            row, col = entries[key]
+            f.write(ENTRY.pack(key, row * width + col))
+
+
+def _replay(height, width, moves):
+    board = Board(height, width)
+    checker = 'X'
+    for row, col in moves:
+        board.add_checker(checker, row, col)
+        checker = 'O' if checker == 'X' else 'X'
+    return board, checker
+
+
+def _book_move(task):
+    """ searches the position after moves in a worker and returns the best
+        move found and the moves to expand the book with.
+    """
+    # main imports this module
+    from main import AIPlayer
+    height, width, moves, time_limit, branching = task
+    board, checker = _replay(height, width, moves)
+    player = AIPlayer(checker, time_limit=time_limit, seed=0)
+    # keep the narrow window of the first moves: on a nearly empty board the
+    # evaluation cannot tell the moves apart, and over the whole board the
+    # search settles on an off-centre one
+    player.num_moves = len(moves) // 2
+    try:
+        move = player.next_move(board)
+        others = [m for m in player.candidate_moves(board, player.num_moves) if m != move]
+    finally:
+        player.close()
+    return move, [move] + others[:branching - 1]
+
+
+def build_book(height=10, width=10, plies=4, branching=3, time_limit=2.0, workers=None):
+    """ searches the positions of the first plies moves with the engine and
+        returns the book entries. From every position, the best move and
+        the branching - 1 next candidates are expanded, and positions
+        already met under a symmetry are searched once.
+    """
+    entries = {}
+    seen = set()
+    lines = [()]
+    with multiprocessing.Pool(workers) as pool:
+        for ply in range(plies):
+            tasks = []
+            keys = []
+            for moves in lines:
+                board, checker = _replay(height, width, moves)
+                key, idx = canonical_key(board)
+                if key in seen:
+                    continue
+                seen.add(key)
+                keys.append(key)
+                tasks.append((height, width, moves, time_limit, branching))
+            lines = []
+            results = pool.imap(_book_move, tasks)
+            for task, key, (move, expand) in zip(tasks, keys, results):
+                board, checker = _replay(height, width, task[2])
+                idx = canonical_key(board)[1]
+                entries[key] = symmetries(height, width)[idx](move[0], move[1])
+                lines.extend(task[2] + (m,) for m in expand)
+            print('ply %d: %d positions searched, %d in the book' % (ply, len(tasks), len(entries)))
+    return entries
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='Build or inspect a Gomoku opening book.')
+    parser.add_argument('command', choices=['build', 'info'])
+    parser.add_argument('path')
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--plies', type=int, default=4)
+    parser.add_argument('--branching', type=int, default=3)
+    parser.add_argument('--time-limit', type=float, default=2.0)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        entries = build_book(args.size, args.size, args.plies, args.branching,
+                             args.time_limit, args.workers)
+        write_book(args.path, args.size, args.size, entries)
+        print(len(entries), 'positions written to', args.path)
+    else:
+        book = OpeningBook(args.path)
+        print('%s: %dx%d board, %d positions' % (args.path, book.height, book.width, len(book)))
+        book.close()
+
+
+if __name__ == '__main__':
+    main_cli()
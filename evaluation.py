@@ -0,0 +1,544 @@
+# Line scoring for the AI player
+#
+# The static evaluation of a position is the sum of an independent score for
+# every row, column and diagonal of the board. This module holds the line
+# scorer, lookup tables compiled from it and an evaluator that keeps that sum
+# up to date move by move. The tables, and the lines too long for them, are
+# scored with an automaton finding all the patterns in one pass over a line;
+# score_line stays as the reference they are checked against.
+#
+# Usage: python evaluation.py --build    writes the line tables to TABLE_FILE
+#        python evaluation.py --verify   checks the tables against score_line
+import array
+import functools
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import random
+import sys
+import numpy as np
+
+# lines up to this length are scored through a lookup table, longer ones
+# (on boards larger than 10x10) are first cut down to the cells around their
+# checkers, see evaluate_line
+TABLE_MAX_LENGTH = 10
+# no pattern is longer than 6 cells, so none reaches further than this from
+# the checkers it contains
+PATTERN_REACH = 5
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'line_tables.bin')
+TABLE_MAGIC = b'GMKT'
+
+
+@functools.lru_cache(maxsize=None)
+def board_lines(height, width):
+    """ returns the lines considered by the static evaluation of a board of
+        the given size, as tuples of (row, col) cells: every row, every
+        column and both families of diagonals, leaving out the diagonals
+        with less than 5 cells (useless for evaluation).
+    """
+    a = np.arange(height*width).reshape(height, width)
+    rows = [a[row, :] for row in range(height)]
+    columns = [a[:, col] for col in range(width)]
+    diags = [a[::-1,:].diagonal(i) for i in range(-a.shape[0]+1,a.shape[1]) if len(a[::-1,:].diagonal(i)) > 4]
+    diags.extend(a.diagonal(i) for i in range(a.shape[1]-1,-a.shape[0],-1) if len(a.diagonal(i)) > 4)
+    return tuple(tuple(divmod(int(i), width) for i in line)
+                 for line in rows + columns + diags)
+
+
+# The patterns looked for by score_line, as data for the evaluators that do
+# not work on strings. 'm' stands for a checker of the point of view, 'o' for
+# an opponent checker. Every group scores at most one pattern: the first one
+# found in the line, which adds the weight of its name (see WEIGHT_NAMES). A
+# THREAT pattern of the second group scores nothing by itself, but adds the
+# weight 'threat_penalty' when the third group finds nothing.
+THREAT = None
+THREAT_PENALTY = -10000
+PATTERN_GROUPS = [
+    [(' oooo ', 'opp_open_four'), ('oooo ', 'opp_four'), (' oooo', 'opp_four'),
+     ('oo oo', 'opp_broken_four'), ('o ooo', 'opp_broken_four'), ('ooo o', 'opp_broken_four')],
+    [(' oo o ', THREAT), (' o oo ', THREAT), (' ooo  ', THREAT), ('  ooo ', THREAT),
+     (' ooo ', 'opp_three'), ('ooo  ', 'opp_three'), ('  ooo', 'opp_three')],
+    [(' mmmm ', 'open_four'), ('mmmm ', 'four'), (' mmmm', 'four'),
+     ('mm mm', 'broken_four'), ('m mmm', 'broken_four'), ('mmm m', 'broken_four')],
+    [(' oo  ', 'opp_two'), ('  oo ', 'opp_two'), ('oo   ', 'opp_two'), ('   oo', 'opp_two')],
+    [(' o o ', 'opp_split_two'), ('o o  ', 'opp_split_two'), ('  o o', 'opp_split_two')],
+    [(' mm m ', 'split_three'), (' m mm ', 'split_three'), (' m m ', 'split_two'),
+     ('m m  ', 'split_two'), ('  m m', 'split_two'),
+     (' mm  ', 'two'), ('  mm ', 'two'), ('mm   ', 'two'), ('   mm', 'two')],
+    [(' mmm  ', 'three'), ('  mmm ', 'three'), ('mmm  ', 'three'), ('  mmm', 'three')],
+]
+
+# The weights of the patterns, as in score_line. Other weights (for example
+# fitted by tune.py) are given to the evaluators as a tuple of values in the
+# order of WEIGHT_NAMES, see weights_vector and load_weights.
+DEFAULT_WEIGHTS = {
+    'opp_open_four': -30000, 'opp_four': -30000, 'opp_broken_four': -20000,
+    'opp_three': -100, 'threat_penalty': THREAT_PENALTY,
+    'open_four': 1000, 'four': 500, 'broken_four': 500,
+    'opp_two': -25, 'opp_split_two': -25,
+    'split_three': 30, 'split_two': 10, 'two': 15, 'three': 30,
+}
+WEIGHT_NAMES = list(DEFAULT_WEIGHTS)
+WEIGHT_INDEX = {name: idx for idx, name in enumerate(WEIGHT_NAMES)}
+DEFAULT_VECTOR = tuple(DEFAULT_WEIGHTS.values())
+
+
+def weights_vector(weights=None):
+    """ returns weights as a tuple of integers in the order of WEIGHT_NAMES.
+        weights is a dictionary {name: value}, whose missing names keep
+        their default weight, a sequence in the order of WEIGHT_NAMES, or
+        None for the default weights.
+    """
+    if weights is None:
+        return DEFAULT_VECTOR
+    if isinstance(weights, dict):
+        unknown = set(weights) - set(WEIGHT_NAMES)
+        if unknown:
+            raise ValueError('unknown weights: %s' % ', '.join(sorted(unknown)))
+        weights = [weights.get(name, DEFAULT_WEIGHTS[name]) for name in WEIGHT_NAMES]
+    if len(weights) != len(WEIGHT_NAMES):
+        raise ValueError('%d weights expected' % len(WEIGHT_NAMES))
+    return tuple(int(round(value)) for value in weights)
+
+
+def load_weights(path):
+    """ returns the weights of a JSON file {name: value} as a tuple.
+    """
+    with open(path) as f:
+        return weights_vector(json.load(f))
+
+
+def save_weights(path, weights):
+    """ writes weights (see weights_vector) to a JSON file {name: value}.
+    """
+    with open(path, 'w') as f:
+        json.dump(dict(zip(WEIGHT_NAMES, weights_vector(weights))), f, indent=1)
+        f.write('\n')
+
+
+def score_line(comp, checker, opp_checker):
+    """ returns the score of one line of the board, given as a string of
+        ' ', 'X' and 'O', from the point of view of checker.
+    """
+    score = 0
+    
+    #PENALTIES IN ORDER OF IMPORTANCE 
+    #PRIORITY 1: Combination for which the opponent win in the next move (with depth 2 the opponent has the next move here)
+    flag_p1 = False
+    if comp.find(' '+opp_checker*4+' ') != -1: #'XXXX'
+        score -= 30000 
+        flag_p1 = True
+    elif comp.find(opp_checker*4+' ') != -1: #XXXX'
+        score -= 30000
+        flag_p1 = True
+    elif comp.find(' '+opp_checker*4) != -1: #'XXXX
+        score -= 30000
+        flag_p1 = True
+    elif comp.find(opp_checker*2+' '+opp_checker*2) != -1: #XX'XX
+        score -= 20000
+        flag_p1 = True
+    elif comp.find(opp_checker+' '+opp_checker*3) != -1: #X'XXX
+        score -= 20000
+        flag_p1 = True
+    elif comp.find(opp_checker*3+' '+opp_checker) != -1: #XXX'X
+        score -= 20000
+        flag_p1 = True
+    #if flag_p1:
+        #score -= 20000 #Loss next move
+        #break #save performance
+    
+    #PRIORITY 2: the opponent win in 2 moves 
+    flag_p2 = False
+    if comp.find(' '+opp_checker*2+' '+opp_checker+' ') != -1: #'XX'X'
+        flag_p2 = True 
+    elif comp.find(' '+opp_checker+' '+opp_checker*2+' ') != -1: #'X'XX'
+        flag_p2 = True
+    elif comp.find(' '+opp_checker*3+' '+' ') != -1: #'XXX''
+        flag_p2 = True
+    elif comp.find('  '+opp_checker*3+' ') != -1: #''XXX'
+        flag_p2 = True
+    elif comp.find(' '+opp_checker*3+' ') != -1: #'XXX'
+        score -= 100
+    elif comp.find(opp_checker*3+' '+' ') != -1: #XXX''
+        score -= 100
+    elif comp.find(' '+' '+opp_checker*3) != -1: #''XXX
+        score -= 100
+    #AGAINST PRIORITY 2: I win in my next move
+    if comp.find(' '+checker*4+' ') != -1: #'XXXX' 
+        score += 1000
+    elif comp.find(checker*4+' ') != -1: #XXXX'
+        score += 500
+    elif comp.find(' '+checker*4) != -1: #'XXXX
+        score += 500
+    elif comp.find(checker*2+' '+checker*2) != -1: #XX'XX
+        score += 500
+    elif comp.find(checker+' '+checker*3) != -1: #X'XXX
+        score += 500
+    elif comp.find(checker*3+' '+checker) != -1: #XXX'X
+        score += 500
+    else:
+        if flag_p2: #need a win for me in my next move to balance
+            score -= 10000 #priority 2 is effective against me
+    
+    #NO PRIORITY THREATS: add simple points 
+    #OPPONENT 
+    if comp.find(' '+opp_checker*2+' '+' ') != -1: #'XX''
+        score -= 25
+    elif comp.find(' '+' '+opp_checker*2+' ') != -1: #''XX'
+        score -= 25
+    elif comp.find(opp_checker*2+' '+' '+' ') != -1: #XX'''
+        score -= 25
+    elif comp.find(' '+' '+' '+opp_checker*2) != -1: #'''XX
+        score -= 25
+    if comp.find(' '+opp_checker+' '+opp_checker+' ') != -1: #'X'X'
+        score -= 25
+    elif comp.find(opp_checker+' '+opp_checker+' '+' ') != -1: #X'X''
+        score -= 25
+    elif comp.find(' '+' '+opp_checker+' '+opp_checker) != -1: #''X'X
+        score -= 25
+    #ME
+    if comp.find(' '+checker*2+' '+checker+' ') != -1: #'XX'X'
+        score += 30
+    elif comp.find(' '+checker+' '+checker*2+' ') != -1: #'X'XX'
+        score += 30 
+    elif comp.find(' '+checker+' '+checker+' ') != -1: #'X'X'
+        score += 10
+    elif comp.find(checker+' '+checker+' '+' ') != -1: #X'X''
+        score += 10
+    elif comp.find(' '+' '+checker+' '+checker) != -1: #''X'X
+        score += 10
+    elif comp.find(' '+checker*2+' '+' ') != -1: #'XX''
+        score += 15
+    elif comp.find(' '+' '+checker*2+' ') != -1: #''XX'
+        score += 15
+    elif comp.find(checker*2+' '+' '+' ') != -1: #XX'''
+        score += 15
+    elif comp.find(' '+' '+' '+checker*2) != -1: #'''XX
+        score += 15
+    if comp.find(' '+checker*3+' '+' ') != -1: #'XXX''
+        score += 30
+    elif comp.find(' '+' '+checker*3+' ') != -1: #''XXX'
+        score += 30 
+    elif comp.find(checker*3+' '+' ') != -1: #XXX''
+        score += 30 
+    elif comp.find(' '+' '+checker*3) != -1: #''XXX
+        score += 30
+        
+    return score
+
+
+class PatternAutomaton:
+    """ an Aho-Corasick automaton matching all the templates of
+    PATTERN_GROUPS at once. Lines are read as digits of line_code (0 for
+    an empty cell, 1 for a checker of the point of view, 2 for an
+    opponent checker), so the same automaton serves both points of view,
+    and one pass over a line gives the bitmask of the templates it holds
+    (bit i for the i-th template of the groups, in order).
+    """
+
+    def __init__(self, groups):
+        self.templates = [template for group in groups for template, value in group]
+        # trie of the templates, then the failure links folded into a
+        # complete transition table: delta[state * 3 + digit]
+        children = [{}]
+        out = [0]
+        for idx, template in enumerate(self.templates):
+            state = 0
+            for ch in template:
+                digit = {' ': 0, 'm': 1, 'o': 2}[ch]
+                if digit not in children[state]:
+                    children[state][digit] = len(children)
+                    children.append({})
+                    out.append(0)
+                state = children[state][digit]
+            out[state] |= 1 << idx
+        self.delta = [0] * (3 * len(children))
+        fail = [0] * len(children)
+        queue = []
+        for digit in range(3):
+            child = children[0].get(digit)
+            if child is not None:
+                self.delta[digit] = child
+                queue.append(child)
+        for state in queue:
+            out[state] |= out[fail[state]]
+            for digit in range(3):
+                child = children[state].get(digit)
+                if child is not None:
+                    fail[child] = self.delta[fail[state] * 3 + digit]
+                    self.delta[state * 3 + digit] = child
+                    queue.append(child)
+                else:
+                    self.delta[state * 3 + digit] = self.delta[fail[state] * 3 + digit]
+        self.out = out
+
+    def match(self, digits):
+        """ returns the bitmask of the templates found in digits.
+        """
+        delta = self.delta
+        out = self.out
+        state = 0
+        mask = 0
+        for digit in digits:
+            state = delta[state * 3 + digit]
+            mask |= out[state]
+        return mask
+
+
+AUTOMATON = PatternAutomaton(PATTERN_GROUPS)
+
+
+@functools.lru_cache(maxsize=None)
+def score_mask(mask, weights=DEFAULT_VECTOR):
+    """ returns the score of a line holding the templates of mask (as
+        given by PatternAutomaton.match), with the rules of score_line:
+        every group scores the weight of its first template found, and a
+        threat of the second group costs 'threat_penalty' if the third group
+        finds nothing.
+    """
+    score = 0
+    bit = 0
+    threat = False
+    for group_idx, group in enumerate(PATTERN_GROUPS):
+        matched = [name for i, (template, name) in enumerate(group)
+                   if mask >> (bit + i) & 1]
+        bit += len(group)
+        if group_idx == 1:
+            threat = bool(matched) and matched[0] is THREAT
+        if matched and matched[0] is not THREAT:
+            score += weights[WEIGHT_INDEX[matched[0]]]
+        elif not matched and group_idx == 2 and threat:
+            score += weights[WEIGHT_INDEX['threat_penalty']]
+    return score
+
+
+def line_digits(chars, checker):
+    """ returns the line_code digits of a line given as a sequence of
+        ' ', 'X' and 'O', from the point of view of checker.
+    """
+    return [0 if ch == ' ' else 1 if ch == checker else 2 for ch in chars]
+
+
+def line_code(chars, checker):
+    """ returns the base-3 code of a line given as a sequence of ' ', 'X'
+        and 'O': the first cell is the most significant digit, an empty
+        cell counts 0, a checker of the point of view 1 and an opponent
+        checker 2.
+    """
+    code = 0
+    for ch in chars:
+        code *= 3
+        if ch == checker:
+            code += 1
+        elif ch != ' ':
+            code += 2
+    return code
+
+
+def _build_table(length, weights=DEFAULT_VECTOR):
+    """ scores every possible line of the given length with weights,
+        indexed by line_code. The lines are walked through AUTOMATON together with all
+        the other lines of the same prefix, one digit at a time.
+    """
+    delta = AUTOMATON.delta
+    out = AUTOMATON.out
+    level = [(0, 0)]
+    for i in range(length):
+        level = [(delta[state * 3 + digit], mask | out[delta[state * 3 + digit]])
+                 for state, mask in level for digit in range(3)]
+    return array.array('i', (score_mask(mask, weights) for state, mask in level))
+
+
+def _tables_header():
+    """ returns the header of a table file: TABLE_MAGIC, TABLE_MAX_LENGTH
+        and a digest of what the default tables are compiled from, the
+        patterns, the default weights and the code scoring the lines, so
+        that a file left by another version is not read.
+    """
+    digest = hashlib.sha256(repr((PATTERN_GROUPS, DEFAULT_VECTOR)).encode())
+    for function in (score_line, PatternAutomaton, score_mask, _build_table):
+        digest.update(inspect.getsource(function).encode())
+    return TABLE_MAGIC + TABLE_MAX_LENGTH.to_bytes(4, 'little') + digest.digest()
+
+
+def _load_tables(path):
+    """ returns the tables stored in path by write_tables, or None if the
+        file is missing or was built for other tables.
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = _tables_header()
+            if f.read(len(header)) != header:
+                return None
+            tables = {}
+            for length in range(1, TABLE_MAX_LENGTH + 1):
+                tables[length] = array.array('i')
+                tables[length].fromfile(f, 3**length)
+            return tables
+    except (OSError, EOFError):
+        return None
+
+
+# tables of every weights vector used, by length
+_tables = {}
+
+def line_table(length, weights=None):
+    """ returns the lookup table of line scores with weights (the default
+        ones if None) for lines of the given length, or None if the length
+        is above TABLE_MAX_LENGTH. The tables of the default weights are
+        read from TABLE_FILE if it exists, otherwise each table is compiled
+        the first time it is needed.
+    """
+    if length > TABLE_MAX_LENGTH:
+        return None
+    if weights is None:
+        weights = DEFAULT_VECTOR
+    tables = _tables.get(weights)
+    if tables is None:
+        if weights == DEFAULT_VECTOR:
+            tables = _load_tables(TABLE_FILE)
+        tables = _tables[weights] = tables or {}
+    if length not in tables:
+        tables[length] = _build_table(length, weights)
+    return tables[length]
+
+
+def write_tables(path=TABLE_FILE):
+    """ compiles the tables of all lengths up to TABLE_MAX_LENGTH and
+        writes them to path.
+    """
+    with open(path, 'wb') as f:
+        f.write(_tables_header())
+        for length in range(1, TABLE_MAX_LENGTH + 1):
+            line_table(length).tofile(f)
+
+
+def verify_tables(max_length=TABLE_MAX_LENGTH, long_lines=100000):
+    """ checks every entry of the tables up to max_length, and long_lines
+        random longer lines, against score_line, from the point of view of
+        both checkers. returns the number of mismatching entries.
+    """
+    errors = 0
+    for length in range(1, max_length + 1):
+        table = line_table(length)
+        for cells in itertools.product(' XO', repeat=length):
+            comp = ''.join(cells)
+            expected = score_line(comp, 'X', 'O')
+            swapped = comp.translate(str.maketrans('XO', 'OX'))
+            if table[line_code(comp, 'X')] != expected or \
+                    table[line_code(swapped, 'O')] != score_line(swapped, 'O', 'X'):
+                print('mismatch for line', repr(comp))
+                errors += 1
+        print('length', length, ':', 3**length, 'lines checked')
+    # longer lines go through the automaton
+    rng = random.Random(0)
+    for i in range(long_lines):
+        comp = ''.join(rng.choice(' XO') for j in range(rng.randint(max_length + 1, 19)))
+        for checker, opp_checker in (('X', 'O'), ('O', 'X')):
+            if score_mask(AUTOMATON.match(line_digits(comp, checker))) != \
+                    score_line(comp, checker, opp_checker):
+                print('mismatch for line', repr(comp))
+                errors += 1
+    print(long_lines, 'longer lines checked')
+    return errors
+
+
+def evaluate_line(chars, checker, opp_checker, weights=None):
+    """ returns score_line for a line given as a sequence of ' ', 'X' and
+        'O', or its score with other weights, through the lookup table when
+        the line is short enough. Every pattern holds a checker, so a longer
+        line scores the same as its part around the checkers, which is
+        looked up instead; a line with no checker scores 0.
+    """
+    table = line_table(len(chars), weights)
+    if table is None:
+        cells = [pos for pos, ch in enumerate(chars) if ch != ' ']
+        if not cells:
+            return 0
+        chars = chars[max(0, cells[0] - PATTERN_REACH):cells[-1] + PATTERN_REACH + 1]
+        table = line_table(len(chars), weights)
+        if table is None:
+            return score_mask(AUTOMATON.match(line_digits(chars, checker)),
+                              weights or DEFAULT_VECTOR)
+    return table[line_code(chars, checker)]
+
+
+class LineEvaluator:
+    """ keeps the static evaluation of a board up to date as checkers are
+    added and taken back. The score of every line is cached and a move
+    only rescores the (at most four) lines through its cell, so that
+    score() always equals AIPlayer.static_eval(board, checker, opp_checker)
+    for the position it tracks (with the weights given, if any). Lines are
+    kept as their line_code, so that rescoring one is a single table access.
+    """
+
+    def __init__(self, board, checker, opp_checker, weights=None):
+        self.checker = checker
+        self.opp_checker = opp_checker
+        self.weights = weights
+        self.lines = board_lines(board.height, board.width)
+        self.cell_lines = [[[] for col in range(board.width)]
+                           for row in range(board.height)]
+        self.codes = []
+        self.tables = []
+        # cells of the lines that are too long for a table
+        self.chars = []
+        self.scores = []
+        for idx, line in enumerate(self.lines):
+            for pos, (row, col) in enumerate(line):
+                self.cell_lines[row][col].append((idx, pos, 3**(len(line)-1-pos)))
+            chars = [board.slots[row][col] for row, col in line]
+            self.codes.append(line_code(chars, checker))
+            self.tables.append(line_table(len(line), weights))
+            self.chars.append(chars if self.tables[idx] is None else None)
+            self.scores.append(evaluate_line(chars, checker, opp_checker, weights))
+        self.total = sum(self.scores)
+        self.undo_stack = []
+
+    def score(self):
+        return self.total
+
+    def add_checker(self, checker, row, col):
+        """ updates the evaluation for checker being added at (row, col).
+        """
+        digit = 1 if checker == self.checker else 2
+        saved = []
+        for idx, pos, power in self.cell_lines[row][col]:
+            self.codes[idx] += digit * power
+            table = self.tables[idx]
+            if table is not None:
+                new = table[self.codes[idx]]
+            else:
+                self.chars[idx][pos] = checker
+                new = evaluate_line(self.chars[idx], self.checker, self.opp_checker,
+                                    self.weights)
+            old = self.scores[idx]
+            self.scores[idx] = new
+            self.total += new - old
+            saved.append((idx, pos, digit * power, old))
+        self.undo_stack.append(saved)
+
+    def undo(self):
+        """ takes back the last checker passed to add_checker.
+        """
+        for idx, pos, delta, old in self.undo_stack.pop():
+            self.codes[idx] -= delta
+            if self.chars[idx] is not None:
+                self.chars[idx][pos] = ' '
+            self.total += old - self.scores[idx]
+            self.scores[idx] = old
+
+
+if __name__ == '__main__':
+    if '--build' in sys.argv[1:]:
+        write_tables()
+        print('line tables written to', TABLE_FILE)
+    elif '--verify' in sys.argv[1:]:
+        if verify_tables():
+            sys.exit(1)
+        print('line tables match score_line')
+    else:
+        print('usage: python evaluation.py --build | --verify')
@@ -1,16 +1,44 @@
 # The script provides a Gomoku Board class and a Player class
 #
 # 
+import functools
 import random
 
+
+@functools.lru_cache(maxsize=None)
+def zobrist_keys(height, width):
+    """ returns the Zobrist keys of a board of the given size: one random
+        64-bit integer per checker and per position, as a dictionary
+        {'X': keys, 'O': keys} of lists of rows. The keys are drawn from a
+        fixed seed, so a position hashes the same in every process.
+    """
+    rng = random.Random(height * 1000 + width)
+    return {checker: [[rng.getrandbits(64) for col in range(width)]
+                      for row in range(height)]
+            for checker in 'XO'}
+
 class Board:
     """ a data type for a Connect Five board with arbitrary dimensions
     """   
     
-    def __init__(self,height=10,width=10):
+    def __init__(self,height=10,width=10,radius=1):
+        """ radius is the distance (in rows and columns) to a checker
+            within which an empty slot belongs to the frontier.
+        """
         self.height = height
         self.width = width
+        self.radius = radius
+        self.offsets = [(dr, dc) for dr in range(-radius, radius+1)
+                        for dc in range(-radius, radius+1) if dr or dc]
         self.slots = [[' ']*width for r in range(height)]
+        self.history = []
+        # Zobrist hash of the position, updated on every add and remove
+        self.zobrist = zobrist_keys(height, width)
+        self.hash = 0
+        # empty slots within radius of a checker, and for every slot the
+        # number of checkers within radius
+        self.frontier = set()
+        self.near = [[0]*width for r in range(height)]
 
     def __repr__(self):
         """ Returns a string representation of a Board object.
@@ -54,9 +82,59 @@ class Board:
         
         if self.can_add_to(row, col):
             self.slots[row][col] = checker
+            self.history.append((checker, row, col))
+            self.hash ^= self.zobrist[checker][row][col]
+            self.frontier.discard((row, col))
+            for dr, dc in self.offsets:
+                r, c = row + dr, col + dc
+                if 0 <= r < self.height and 0 <= c < self.width:
+                    self.near[r][c] += 1
+                    if self.slots[r][c] == ' ':
+                        self.frontier.add((r, c))
+
+    def remove_checker(self, row, col):
+        """ removes the checker at position (row, col) from the called
+            Board, leaving the slot empty.
+            input: row, col are the coordinates of an occupied slot
+        """
+        assert(self.slots[row][col] != ' ')
+
+        move = (self.slots[row][col], row, col)
+        self.slots[row][col] = ' '
+        self.hash ^= self.zobrist[move[0]][row][col]
+        if self.history[-1] == move:
+            self.history.pop()
+        else:
+            self.history.remove(move)
+        for dr, dc in self.offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < self.height and 0 <= c < self.width:
+                self.near[r][c] -= 1
+                if self.near[r][c] == 0:
+                    self.frontier.discard((r, c))
+        if self.near[row][col] > 0:
+            self.frontier.add((row, col))
+
+    def last_move(self):
+        """ returns the last move played on the called Board as a tuple
+            (checker, row, col), or None if the Board is empty.
+        """
+        return self.history[-1] if self.history else None
+
+    def undo(self):
+        """ takes back the last checker added to the called Board and
+            returns it as a tuple (checker, row, col).
+        """
+        move = self.history[-1]
+        self.remove_checker(move[1], move[2])
+        return move
             
     def reset(self):
         self.slots = [[' ']*self.width for r in range(self.height)]
+        self.history = []
+        self.hash = 0
+        self.frontier = set()
+        self.near = [[0]*self.width for r in range(self.height)]
 
     def is_full(self):
         for r in range(self.height):
@@ -105,7 +183,7 @@ class Board:
         for i in range(5):
             # Check if the next four rows in this col
             # contain the specified checker.            
-            if r+i < self.width and self.slots[r+i][c] == checker:
+            if r+i < self.height and self.slots[r+i][c] == checker:
                 cnt += 1
             else:
                 break
@@ -173,10 +251,16 @@ class Board:
         return False 
 
 class Player:
-    def __init__(self,checker):
+    def __init__(self,checker,seed=None):
+        """ seed initializes the random number generator of the player
+            (rng), so that games can be replayed. clock is the
+            timecontrol.GameClock of the player in a timed game.
+        """
         assert(checker == 'X' or checker == 'O')
         self.checker = checker
         self.num_moves = 0
+        self.rng = random.Random(seed)
+        self.clock = None
 
     def __repr__(self):
         return "Player: "+self.checker
@@ -226,4 +310,4 @@ class RandomPlayer(Player):
                 if board.can_add_to(row, col):
                     open_pos.append((row, col))
         
-        return random.choice(open_pos)
\ No newline at end of file
+        return self.rng.choice(open_pos)
\ No newline at end of file
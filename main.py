@@ -1,18 +1,93 @@
 # Implement an AI Player for Gomoku
 # A Random Player is provided for you
 
-from gomoku import Player, Board
+from gomoku import Player
+from evaluation import LineEvaluator, board_lines, evaluate_line, load_weights, weights_vector
+from transposition import TranspositionTable, last_move_keys, EXACT, LOWER, UPPER
+from parallel import RootSearchPool
+from threats import find_win, find_defences
+from stats import SearchStats, instrument, uninstrument
+from book import OpeningBook
+from timecontrol import TimeManager
 import math
-import numpy as np
 import copy
+import threading
 import time
 
+class SearchTimeout(Exception):
+    """ raised inside the search when the time for the move is up.
+    """
+    pass
+
+
 class AIPlayer(Player):
     """ a subclass of Player that looks ahead some number of moves and 
     strategically determines its best next move.
     """
     
-    previous_board = Board(10,10)
+    #Share of time_limit given to the threat-space search of each side
+    THREAT_TIME_SHARE = 0.1
+    #Number of opponent replies searched in advance when pondering, and
+    #the most time pondering may take, in times time_limit
+    PONDER_REPLIES = 3
+    PONDER_TIME_FACTOR = 4
+
+    def __init__(self, checker, time_limit=5.0, max_depth=8, tt_size_mb=16, workers=None, seed=None, threat_depth=10, stats=None, ponder=False, book=None, clock=None, weights=None):
+        """ time_limit is the time in seconds allowed for each move,
+            max_depth the deepest iteration of the search and tt_size_mb the
+            memory cap of the transposition table, which is kept for the
+            whole game. With workers set to a number of processes, the root
+            moves are searched in parallel by a pool of that size, created
+            on the first move and reused until close() is called.
+            threat_depth is the number of threats searched by the forced win
+            search run before minimax (0 to turn it off).
+            With stats set to True, every move fills a stats.SearchStats
+            object, kept in last_stats; stats can also be a callable (for
+            example a stats.JsonLinesSink), which is then given each one.
+            With ponder set to True, the player keeps searching the likely
+            replies of the opponent in a background thread after each move,
+            and the next move starts from that work when the reply was one
+            of them. Pondering uses the serial search, even with workers.
+            book is the path of an opening book (see book.py), whose moves
+            are played without searching.
+            clock is the timecontrol.GameClock of the player for a timed
+            game, which it may also be given later; the time of every move
+            is then shared out of the clock instead of being time_limit.
+            weights are the weights of the evaluation patterns: the path of
+            a JSON file (see tune.py), a dictionary or a sequence accepted by
+            evaluation.weights_vector, or None for the default ones.
+        """
+        Player.__init__(self, checker, seed)
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.threat_depth = threat_depth
+        self.tt_size_mb = tt_size_mb
+        self.tt = TranspositionTable(tt_size_mb)
+        #Move ordering: killer moves per ply and history scores per checker
+        self.killers = {}
+        self.history = {'X': [], 'O': []}
+        self.workers = workers
+        self.pool = None
+        self.stats = stats
+        self.last_stats = None
+        self.ponder = ponder
+        self.ponder_thread = None
+        #Set to stop the search running in the background thread
+        self.stop_event = threading.Event()
+        #Results of pondering, by position: (depth, candidates, score)
+        self.ponder_results = {}
+        #Principal variation of the last search, from the position of
+        #length pv_root_len, and the transposition table keys along it
+        self.pv = []
+        self.pv_keys = []
+        self.pv_root_len = 0
+        self.book = OpeningBook(book) if book is not None else None
+        self.clock = clock
+        self.time_manager = None
+        if isinstance(weights, str):
+            self.weights = load_weights(weights)
+        else:
+            self.weights = weights_vector(weights)
   
     @staticmethod
     def get_evaluation_range(board, counter):
@@ -25,10 +100,11 @@ class AIPlayer(Player):
             colE = board.width
         else:
             #print("Small evaluation range")
-            rowS = 3
-            rowE = board.height-3
-            colS = 3
-            colE = board.width-3
+            #5x5 window around the centre, whatever the board size
+            rowS = board.height//2 - 2
+            rowE = rowS + 4
+            colS = board.width//2 - 2
+            colE = colS + 4
         return int(rowS), int(rowE), int(colS), int(colE)
 
 
@@ -40,274 +116,498 @@ class AIPlayer(Player):
             return: row, col are the coordinated of a vacant location on the board 
         """
         start = time.time()
+        self.stop_pondering()
         self.num_moves += 1
+        self.start_search()
         assert(board.is_full() == False)
+        #If the game followed the principal variation, the subtree of the
+        #position reached is kept; the rest of the table ages out
+        played = [(row, col) for ch, row, col in board.history[self.pv_root_len:]]
+        if played and played == self.pv[:len(played)]:
+            self.tt.retain(self.pv_keys[len(played)-1:])
+        stats = None
+        if self.stats:
+            stats = SearchStats(self.checker, self.num_moves)
+            instrument(self, stats)
+        #Time of the move: time_limit, or a soft and a hard limit taken
+        #from the clock of a timed game
+        soft = hard = self.time_limit
+        if self.clock is not None:
+            if self.time_manager is None or self.time_manager.clock is not self.clock:
+                self.time_manager = TimeManager(self.clock)
+            soft, hard = self.time_manager.allocate(board, self.num_moves)
     
-        counter = self.num_moves
-        rowS, rowE, colS, colE = self.get_evaluation_range(board, counter)
-        
-        if counter >= 3:
-            last_opp_move_row = 0
-            last_opp_move_col = 0
-            for row in range(board.height):
-                for col in range(board.width): 
-                    if self.previous_board.can_add_to(row, col) != board.can_add_to(row, col):
-                        last_opp_move_row = row
-                        last_opp_move_col = col
-                        break
-                if last_opp_move_row != 0:
-                    break
-                
-        #Find all the open position (without a marker X or O)
-        open_pos_priority_1 = []
-        open_pos_priority_2 = []
-        open_pos_no_priority = []
-        for row in range(rowS,rowE+1):
-            for col in range(colS,colE+1):
-                if board.can_add_to(row, col):
-                    #priority if close to opp last move
-                    if counter >= 3:
-                        flag_priority_1 = False
-                        if last_opp_move_row == row-1 and last_opp_move_col == col-1:
-                            flag_priority_1 = True
-                        elif last_opp_move_row == row-1 and last_opp_move_col == col:
-                            flag_priority_1 = True
-                        elif last_opp_move_row == row-1 and last_opp_move_col == col+1:
-                            flag_priority_1 = True
-                        elif last_opp_move_row == row and last_opp_move_col == col-1:
-                            flag_priority_1 = True
-                        elif last_opp_move_row == row and last_opp_move_col == col+1:
-                            flag_priority_1 = True
-                        elif last_opp_move_row == row+1 and last_opp_move_col == col-1:
-                            flag_priority_1 = True
-                        elif last_opp_move_row == row+1 and last_opp_move_col == col:
-                            flag_priority_1 = True
-                        elif last_opp_move_row == row+1 and last_opp_move_col == col+1:
-                            flag_priority_1 = True
-                        if flag_priority_1:
-                            open_pos_priority_1.append((row, col))
-                            continue
-                    #priority if one neighboor has a checker
-                    flag_priority_2 = False
-                    if row-1 >= 0 and col-1 >= 0 and not board.can_add_to(row-1, col-1):
-                        flag_priority_2 = True
-                    elif row-1 >= 0  and not board.can_add_to(row-1, col) :
-                        flag_priority_2 = True
-                    elif row-1 >= 0 and col+1 <= 9 and not board.can_add_to(row-1, col+1) :
-                        flag_priority_2 = True
-                    elif col-1 >= 0 and not board.can_add_to(row, col-1) :
-                        flag_priority_2 = True
-                    elif col+1 <= 9 and not board.can_add_to(row, col+1) :
-                        flag_priority_2 = True
-                    elif row+1 <= 9 and col-1 >= 0 and not board.can_add_to(row+1, col-1) :
-                        flag_priority_2 = True
-                    elif row+1 <= 9 and not board.can_add_to(row+1, col) :
-                        flag_priority_2 = True
-                    elif row+1 <= 9 and col+1 <= 9 and not board.can_add_to(row+1, col+1) :
-                        flag_priority_2 = True
-                    if flag_priority_2:
-                        open_pos_priority_2.append((row, col))
-                    else:
-                        open_pos_no_priority.append((row, col))
-                        
-        #Shuffle for best performances
-        np.random.shuffle(open_pos_no_priority)
-        np.random.shuffle(open_pos_priority_2)
-        np.random.shuffle(open_pos_priority_1)
-        open_pos = []
-        if len(open_pos_priority_1) == 0 and len(open_pos_priority_2) == 0:
-            open_pos = open_pos_no_priority
+        book_move = self.book.lookup(board) if self.book is not None else None
+        if book_move is not None:
+            open_pos = [book_move]
+            if stats is not None:
+                stats.forced = 'book'
         else:
-            if counter >= 3:
-                open_pos = open_pos_priority_1 + open_pos_priority_2
+            open_pos = self.candidate_moves(board, self.num_moves)
+        
+        #Forced wins first: play one of ours, or only consider the moves
+        #that stop the opponent's
+        defence = False
+        if self.threat_depth > 0 and len(board.history) > 0 and book_move is None:
+            threat_board = copy.deepcopy(board)
+            threat_time = soft * self.THREAT_TIME_SHARE
+            line = find_win(threat_board, self.checker, self.threat_depth, start + threat_time)
+            if line is not None:
+                open_pos = [line[0]]
+                if stats is not None:
+                    stats.forced = 'win'
             else:
-                open_pos = open_pos_priority_2
+                line = find_win(threat_board, self.opponent_checker(), self.threat_depth, start + 2*threat_time)
+                if line is not None:
+                    defences = find_defences(threat_board, self.checker, line, self.threat_depth, start + 3*threat_time)
+                    if defences:
+                        open_pos = [move for move in open_pos if move in defences] or defences
+                        defence = True
+                        if stats is not None:
+                            stats.forced = 'defence'
+        if self.clock is not None:
+            self.time_manager.forcing(len(open_pos), defence)
+            hard = self.time_manager.hard
+        
+        #Work done on this position by earlier searches, if any
+        reused = self.reuse_search(board, open_pos)
+        self.ponder_results = {}
         
         maxEval = -math.inf
         bestMove = ()
-        depth = 2
         if len(open_pos) == 1:
             bestMove = open_pos[0]
         else:
-            for move in open_pos:
-                val = self.minimax(self, self.checker, move, board, depth, -math.inf, math.inf, True, open_pos)
-                if val > maxEval:
-                    maxEval = val
-                    bestMove = move
-                #print("*********Evaluating move: ", move, " -score = ", val)
-                if time.time() - start >= 5.0:
-                    #print("Break timeout during evaluation of move: ", move)
+            #Iterative deepening: search depth 0, 1, 2, ... until the time
+            #is up, keeping the best move of the last completed depth
+            self.deadline = start + hard
+            self.nodes = 0
+            bestMove = open_pos[0]
+            first_depth = 0
+            depths = []
+            if reused is not None:
+                #Carry on from the last depth already known
+                source, done_depth, open_pos, maxEval = reused
+                first_depth = max(0, done_depth + 1)
+                bestMove = open_pos[0]
+                if stats is not None:
+                    stats.reused = {'source': source, 'depth': done_depth}
+                if maxEval != -math.inf and abs(maxEval) >= 100000:
+                    first_depth = self.max_depth + 1
+                elif source == 'tree' and first_depth > 0:
+                    #The table only gives the best move, not the scores of
+                    #the others: depth 0 is completed first, so that the
+                    #move played always comes from a finished depth
+                    depths = [0]
+            for depth in depths + list(range(first_depth, self.max_depth + 1)):
+                try:
+                    scores = self.search_root(board, open_pos, depth)
+                except SearchTimeout:
+                    break
+                #Best moves of this depth are searched first at the next
+                #one, but the table's move stays first after a skipped depth
+                order = sorted(open_pos, key=lambda move: -scores[move])
+                if depth >= first_depth:
+                    open_pos = order
+                bestMove = order[0]
+                maxEval = scores[bestMove]
+                if stats is not None:
+                    stats.add_depth(depth, time.time() - start, bestMove, maxEval)
+                if abs(maxEval) >= 100000:
+                    break
+                if self.clock is not None and self.time_manager.stop_after(time.time() - start, bestMove):
                     break
         #print("best move: ", bestMove, "-score ",maxEval) 
         
-        if counter >= 2:
-            self.previous_board = copy.deepcopy(board)
-            self.previous_board.add_checker(self.checker, bestMove[0], bestMove[1])
-        
+        if stats is not None:
+            uninstrument(self)
+            stats.candidates = len(open_pos)
+            stats.move = bestMove
+            stats.score = maxEval if maxEval != -math.inf else None
+            stats.seconds = time.time() - start
+            self.last_stats = stats
+            if callable(self.stats):
+                self.stats(stats)
+        self.pv, self.pv_keys = self.principal_variation(board, bestMove)
+        self.pv_root_len = len(board.history)
+        if self.ponder:
+            self.start_pondering(board, bestMove)
         return bestMove
 
-      
-    def minimax(self, player, ch, move, board, depth, alpha, beta, isMaximizing, pos_move):
+    def reuse_search(self, board, open_pos):
+        """ returns what earlier searches left about the position of board,
+            as (source, depth, candidates, score): depth is the last depth
+            known for every candidate (-1 or less if none), candidates are
+            open_pos in the order to search them and score the one of the
+            first candidate (-math.inf if unknown). Pondering leaves complete
+            results; otherwise the transposition table may still hold the
+            position from the subtree of the last search, with the best move
+            found there. returns None if nothing is known.
+        """
+        pondered = self.ponder_results.get((board.hash, len(board.history)))
+        if pondered is not None and set(pondered[1]) == set(open_pos):
+            return 'ponder', pondered[0], list(pondered[1]), pondered[2]
+        last_move = board.last_move()
+        if last_move is None or len(open_pos) < 2:
+            return None
+        entry = self.tt.probe(board.hash ^ last_move_keys(board.height, board.width)[last_move[1]][last_move[2]])
+        #Only an exact score makes its move the best one; a bound's move
+        #merely caused a cutoff
+        if entry is None or entry[2] != EXACT or entry[4] not in open_pos:
+            return None
+        #The moves below the position were searched to entry[1]-1 plies,
+        #but only the best one of them for sure
+        candidates = [entry[4]] + [move for move in open_pos if move != entry[4]]
+        return 'tree', entry[1] - 2, candidates, -math.inf
+
+    def principal_variation(self, board, move):
+        """ returns the principal variation starting with move on board,
+            read from the transposition table, and the keys of the table
+            entries along it. It is at most max_depth + 1 moves long.
+        """
+        pv_board = copy.deepcopy(board)
+        keys = last_move_keys(board.height, board.width)
+        pv = []
+        pv_keys = []
+        ch = self.checker
+        while move is not None and len(pv) <= self.max_depth and pv_board.can_add_to(move[0], move[1]):
+            pv_board.add_checker(ch, move[0], move[1])
+            pv.append(move)
+            if pv_board.is_win_for(ch, move[0], move[1]) or pv_board.is_full():
+                break
+            key = pv_board.hash ^ keys[move[0]][move[1]]
+            pv_keys.append(key)
+            entry = self.tt.probe(key)
+            move = entry[4] if entry is not None else None
+            ch = 'O' if ch == 'X' else 'X'
+        return pv, pv_keys
+
+    def candidate_moves(self, board, counter):
+        """ returns the moves considered on board for the move number
+            counter of the player, the most promising first.
+        """
+        rowS, rowE, colS, colE = self.get_evaluation_range(board, counter)
+        
+        #Candidates are read from the board frontier (the empty slots next
+        #to a checker), with priority if close to the opponent's last move
+        last_move = board.last_move()
+        open_pos_priority_1 = []
+        open_pos_priority_2 = []
+        open_pos_no_priority = []
+        for row, col in board.frontier:
+            if row < rowS or row > rowE or col < colS or col > colE:
+                continue
+            if counter >= 3 and last_move is not None and last_move[0] != self.checker \
+                    and abs(row - last_move[1]) <= 1 and abs(col - last_move[2]) <= 1:
+                open_pos_priority_1.append((row, col))
+            else:
+                open_pos_priority_2.append((row, col))
+        if len(open_pos_priority_1) == 0 and len(open_pos_priority_2) == 0:
+            #Nothing near a checker yet: any open position of the window
+            for row in range(rowS, min(rowE+1, board.height)):
+                for col in range(colS, min(colE+1, board.width)):
+                    if board.can_add_to(row, col):
+                        open_pos_no_priority.append((row, col))
+                        
+        #Most promising moves first, for best performances
+        for bucket in (open_pos_no_priority, open_pos_priority_2, open_pos_priority_1):
+            bucket.sort(key=lambda m: (-self.move_score(board, self.checker, m[0], m[1]), m))
+        if len(open_pos_priority_1) == 0 and len(open_pos_priority_2) == 0:
+            return open_pos_no_priority
+        if counter >= 3:
+            return open_pos_priority_1 + open_pos_priority_2
+        return open_pos_priority_2
+
+    def start_pondering(self, board, move):
+        """ starts searching, in a background thread, the positions after
+            the likely replies to move (about to be played on board).
+        """
+        ponder_board = copy.deepcopy(board)
+        ponder_board.add_checker(self.checker, move[0], move[1])
+        if ponder_board.is_win_for(self.checker, move[0], move[1]) or ponder_board.is_full():
+            return
+        self.ponder_thread = threading.Thread(target=self.ponder_replies, args=(ponder_board, move))
+        self.ponder_thread.daemon = True
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        """ stops the background search, if any, and waits for it.
+        """
+        if self.ponder_thread is not None:
+            self.stop_event.set()
+            self.ponder_thread.join()
+            self.ponder_thread = None
+            self.stop_event.clear()
+
+    def ponder_replies(self, board, move):
+        """ searches the positions after the PONDER_REPLIES most likely
+            replies of the opponent to move (played last on board), one
+            depth at a time for all of them, until stop_pondering() is
+            called or for PONDER_TIME_FACTOR times time_limit at most. The
+            results are kept in ponder_results.
+        """
+        opp = self.opponent_checker()
+        #The reply found by the search of move comes first
+        entry = self.tt.probe(board.hash ^ last_move_keys(board.height, board.width)[move[0]][move[1]])
+        replies = sorted(board.frontier, key=lambda m: (-self.move_score(board, opp, m[0], m[1]), m))
+        if entry is not None and entry[4] in board.frontier:
+            replies.remove(entry[4])
+            replies.insert(0, entry[4])
+        positions = []
+        for reply in replies[:self.PONDER_REPLIES]:
+            board.add_checker(opp, reply[0], reply[1])
+            if not board.is_win_for(opp, reply[0], reply[1]) and not board.is_full():
+                positions.append((reply, self.candidate_moves(board, self.num_moves + 1)))
+            board.undo()
         
-        new_board = copy.deepcopy(board)
-        new_board.add_checker(ch, move[0], move[1])
-        new_pos_move = pos_move.copy()
-        del pos_move
-        new_pos_move.remove(move)
+        self.start_search()
+        self.deadline = time.time() + self.PONDER_TIME_FACTOR * self.time_limit
+        self.nodes = 0
+        try:
+            for depth in range(self.max_depth + 1):
+                for reply, open_pos in positions:
+                    board.add_checker(opp, reply[0], reply[1])
+                    try:
+                        key = (board.hash, len(board.history))
+                        done = self.ponder_results.get(key)
+                        #Nothing left to search once the result is decided
+                        if len(open_pos) > 1 and (done is None or abs(done[2]) < 100000):
+                            scores = self.search_root(board, open_pos, depth, serial=True)
+                            open_pos.sort(key=lambda m: -scores[m])
+                            self.ponder_results[key] = (depth, list(open_pos), scores[open_pos[0]])
+                    finally:
+                        board.undo()
+        except SearchTimeout:
+            pass
+
+
+    def new_game(self):
+        """ forgets what the player kept from the game it was playing: the
+            transposition table, the move ordering tables, the principal
+            variation and the results of pondering.
+        """
+        self.stop_pondering()
+        self.tt.clear()
+        self.killers = {}
+        self.history = {'X': [], 'O': []}
+        self.ponder_results = {}
+        self.pv = []
+        self.pv_keys = []
+        self.pv_root_len = 0
+
+    def start_search(self):
+        """ resets the move ordering tables for a new move: killer moves
+            are forgotten and the history scores fade.
+        """
+        self.tt.new_search()
+        self.killers = {}
+        for table in self.history.values():
+            for row in table:
+                for col in range(len(row)):
+                    row[col] //= 2
+
+    def search_root(self, board, open_pos, depth, serial=False):
+        """ searches every move of open_pos to the given depth and returns
+            their scores as a dictionary. The moves are searched in order,
+            each one with the best score found so far as alpha, so a move
+            that is no better than an earlier one only gets an upper bound.
+            With a worker pool the moves are shared out between the workers,
+            unless serial is True.
+        """
+        if self.workers is not None and not serial:
+            if self.pool is None:
+                self.pool = RootSearchPool(self.workers)
+            return self.pool.search(self, board, open_pos, depth, self.deadline)
+        #The whole tree is searched in place on a single copy of the board
+        search_board = copy.deepcopy(board)
+        self.evaluator = LineEvaluator(search_board, self.checker, self.opponent_checker(), self.weights)
+        self.root_len = len(search_board.history)
+        scores = {}
+        alpha = -math.inf
+        for move in open_pos:
+            scores[move] = self.minimax(self, self.checker, move, search_board, depth, alpha, math.inf, False)
+            alpha = max(alpha, scores[move])
+        return scores
+
+    def close(self):
+        """ stops pondering and shuts down the worker pool of the player,
+            if any.
+        """
+        self.stop_pondering()
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+      
+    def minimax(self, player, ch, move, board, depth, alpha, beta, isMaximizing):
+        """ plays move for ch on board, evaluates the resulting position and
+            takes the move back before returning, so board is left exactly
+            as it was passed in. The replies searched are the slots of the
+            board frontier, played by player if isMaximizing and by its
+            opponent otherwise. Scores are from the point of view of
+            player. Raises
+            SearchTimeout (leaving them in an undefined state) once the
+            deadline of the current search has passed or stop_event is set.
+        """
+        self.nodes += 1
+        if self.nodes % 256 == 0 and (time.time() >= self.deadline or self.stop_event.is_set()):
+            raise SearchTimeout()
+        board.add_checker(ch, move[0], move[1])
+        self.evaluator.add_checker(ch, move[0], move[1])
         
-        win = new_board.is_win_for(ch, move[0], move[1])
+        win = board.is_win_for(ch, move[0], move[1])
         if depth == 0 or win:
             if win:
                 if ch == player.opponent_checker():
-                    return -100000 #Direct loss
+                    val = -100000 #Direct loss
                 else:
-                    return 100000 #Direct win
-            else: #depth=0
-                return self.static_eval(new_board, ch, player.opponent_checker())
+                    val = 100000 #Direct win
+            else: #depth=0, always scored from the point of view of player
+                val = self.evaluator.score()
         
-        #MAXIMIZING        
+        else:
+            #Look the position up in the transposition table
+            key = board.hash ^ last_move_keys(board.height, board.width)[move[0]][move[1]]
+            entry = self.tt.probe(key)
+            tt_move = None
+            val = None
+            if entry is not None:
+                tt_move = entry[4]
+                if entry[1] >= depth:
+                    if entry[2] == EXACT:
+                        val = entry[3]
+                    elif entry[2] == LOWER:
+                        alpha = max(alpha, entry[3])
+                    else:
+                        beta = min(beta, entry[3])
+                    if val is None and beta <= alpha:
+                        val = entry[3]
+            if val is None:
+                val, best_move = self.search_children(player, move, board, depth, alpha, beta, isMaximizing, tt_move)
+                if val <= alpha:
+                    flag = UPPER
+                elif val >= beta:
+                    flag = LOWER
+                else:
+                    flag = EXACT
+                self.tt.store(key, depth, flag, val, best_move)
+
+        self.evaluator.undo()
+        board.undo()
+        return val
+         
+        
+    def order_moves(self, board, ch, depth, first_move=None):
+        """ returns the moves of the board frontier, in the order ch should
+            search them: first_move (the transposition table move), then the
+            killer moves of this ply, then the others by decreasing history
+            score. The static move score is only used at the root (see
+            candidate_moves): inside the tree it costs more than the nodes it
+            saves. Replies that are leaves (depth 1) are cheaper to search
+            than to sort, so the others are only sorted by position for them.
+        """
+        history = self.history[ch]
+        if len(history) != board.height:
+            history[:] = [[0]*board.width for r in range(board.height)]
+        if depth > 1:
+            moves = sorted(board.frontier, key=lambda m: (-history[m[0]][m[1]], m))
+        else:
+            moves = sorted(board.frontier)
+        ply = len(board.history) - self.root_len
+        front = [first_move] + self.killers.get(ply, [])
+        first = []
+        for m in front:
+            if m is not None and m not in first and m in board.frontier:
+                first.append(m)
+        if first:
+            moves = first + [m for m in moves if m not in first]
+        return moves
+
+    def record_cutoff(self, board, ch, child_move, depth):
+        """ remembers child_move, played by ch, as having caused a cutoff.
+        """
+        ply = len(board.history) - self.root_len
+        killers = self.killers.setdefault(ply, [])
+        if child_move not in killers:
+            killers.insert(0, child_move)
+            del killers[2:]
+        self.history[ch][child_move[0]][child_move[1]] += depth * depth
+
+    @staticmethod
+    def move_score(board, ch, row, col):
+        """ a cheap static score of ch playing at (row, col): for every
+            direction, the length of the runs of own checkers it extends and
+            of opponent checkers it blocks, longer runs weighing much more.
+        """
+        score = 0
+        slots = board.slots
+        for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for who in ('X', 'O'):
+                run = 0
+                for sign in (1, -1):
+                    r, c = row + sign*dr, col + sign*dc
+                    while 0 <= r < board.height and 0 <= c < board.width and slots[r][c] == who:
+                        run += 1
+                        r += sign*dr
+                        c += sign*dc
+                if run:
+                    score += 4**min(run, 4) * (2 if who == ch else 1)
+        return score
+
+    def search_children(self, player, move, board, depth, alpha, beta, isMaximizing, first_move=None):
+        """ searches the replies to move (already played on board), in the
+            order given by order_moves: those of player if isMaximizing,
+            otherwise those of the opponent, after a move of player. returns
+            the value of the position and the best reply.
+        """
+        child_ch = player.checker if isMaximizing else player.opponent_checker()
+        child_moves = self.order_moves(board, child_ch, depth, first_move)
+        best_move = None
+        
+        #MAXIMIZING: player's replies
         if isMaximizing:
-            maxEval = -math.inf
-            for child_move in new_pos_move:
-                pos_value = min(move[0], board.height - move[0]) * min(move[1], board.width - move[1]) / 10.0
-                val = self.minimax(player, player.opponent_checker(), child_move, new_board, depth - 1, alpha, beta, False, new_pos_move)
-                if val >= 0:
-                    val += pos_value
-                maxEval = max(maxEval, val)
-                alpha = max(alpha, val)
+            val = -math.inf
+            for child_move in child_moves:
+                child_val = self.minimax(player, player.checker, child_move, board, depth - 1, alpha, beta, False)
+                if child_val > val:
+                    val = child_val
+                    best_move = child_move
+                alpha = max(alpha, child_val)
                 if beta <= alpha:
+                    self.record_cutoff(board, child_ch, child_move, depth)
                     break
-            return maxEval
         
-        #MINIMIZING
+        #MINIMIZING: the opponent's replies to player's move, which gets a
+        #small bonus for being central
         else:
-            minEval = math.inf
-            for child_move in new_pos_move:
-                val = self.minimax(player, player.checker, child_move, new_board, depth - 1, alpha, beta, True, new_pos_move)
-                minEval = min(minEval, val)
-                beta = min(beta, val)
+            val = math.inf
+            pos_value = min(move[0], board.height - move[0]) * min(move[1], board.width - move[1]) / 10.0
+            for child_move in child_moves:
+                child_val = self.minimax(player, player.opponent_checker(), child_move, board, depth - 1, alpha, beta, True)
+                if child_val >= 0:
+                    child_val += pos_value
+                if child_val < val:
+                    val = child_val
+                    best_move = child_move
+                beta = min(beta, child_val)
                 if beta <= alpha:
+                    self.record_cutoff(board, child_ch, child_move, depth)
                     break
-            return minEval
-         
+        return val, best_move
         
     @staticmethod  
-    def static_eval(board, checker, opp_checker):
+    def static_eval(board, checker, opp_checker, weights=None):
         
         #Do not consider diagonals with less than 4 element (useless for evaluation)
-        rows = [''.join(board.slots[row]) for row in range(board.height)]
-        columns = [''.join([row[col] for row in rows]) for col in range(board.width)]
-        a = np.array(board.slots)
-        diags = [a[::-1,:].diagonal(i) for i in range(-a.shape[0]+1,a.shape[1]) if len(a[::-1,:].diagonal(i)) > 4]
-        diags.extend(a.diagonal(i) for i in range(a.shape[1]-1,-a.shape[0],-1) if len(a.diagonal(i)) > 4)
-        diagonals = [''.join(n.tolist()) for n in diags]
-        
-        #10 rows, 10 cols, 11*2 diagonals = tot 42 elements to consider for evaluation 
-        l = rows + columns + diagonals
+        #10x10: 10 rows, 10 cols, 11*2 diagonals = tot 42 elements to consider for evaluation 
+        #Lines without a checker score 0 and cost almost nothing
+        l = [[board.slots[row][col] for row, col in line]
+             for line in board_lines(board.height, board.width)]
         score = 0
         
-        #PENALTIES IN ORDER OF IMPORTANCE 
         for comp in l:
-            #PRIORITY 1: Combination for which the opponent win in the next move (with depth 2 the opponent has the next move here)
-            flag_p1 = False
-            if comp.find(' '+opp_checker*4+' ') != -1: #'XXXX'
-                score -= 30000 
-                flag_p1 = True
-            elif comp.find(opp_checker*4+' ') != -1: #XXXX'
-                score -= 30000
-                flag_p1 = True
-            elif comp.find(' '+opp_checker*4) != -1: #'XXXX
-                score -= 30000
-                flag_p1 = True
-            elif comp.find(opp_checker*2+' '+opp_checker*2) != -1: #XX'XX
-                score -= 20000
-                flag_p1 = True
-            elif comp.find(opp_checker+' '+opp_checker*3) != -1: #X'XXX
-                score -= 20000
-                flag_p1 = True
-            elif comp.find(opp_checker*3+' '+opp_checker) != -1: #XXX'X
-                score -= 20000
-                flag_p1 = True
-            #if flag_p1:
-                #score -= 20000 #Loss next move
-                #break #save performance
-            
-            #PRIORITY 2: the opponent win in 2 moves 
-            flag_p2 = False
-            if comp.find(' '+opp_checker*2+' '+opp_checker+' ') != -1: #'XX'X'
-                flag_p2 = True 
-            elif comp.find(' '+opp_checker+' '+opp_checker*2+' ') != -1: #'X'XX'
-                flag_p2 = True
-            elif comp.find(' '+opp_checker*3+' '+' ') != -1: #'XXX''
-                flag_p2 = True
-            elif comp.find('  '+opp_checker*3+' ') != -1: #''XXX'
-                flag_p2 = True
-            elif comp.find(' '+opp_checker*3+' ') != -1: #'XXX'
-                score -= 100
-            elif comp.find(opp_checker*3+' '+' ') != -1: #XXX''
-                score -= 100
-            elif comp.find(' '+' '+opp_checker*3) != -1: #''XXX
-                score -= 100
-            #AGAINST PRIORITY 2: I win in my next move
-            if comp.find(' '+checker*4+' ') != -1: #'XXXX' 
-                score += 1000
-            elif comp.find(checker*4+' ') != -1: #XXXX'
-                score += 500
-            elif comp.find(' '+checker*4) != -1: #'XXXX
-                score += 500
-            elif comp.find(checker*2+' '+checker*2) != -1: #XX'XX
-                score += 500
-            elif comp.find(checker+' '+checker*3) != -1: #X'XXX
-                score += 500
-            elif comp.find(checker*3+' '+checker) != -1: #XXX'X
-                score += 500
-            else:
-                if flag_p2: #need a win for me in my next move to balance
-                    score -= 10000 #priority 2 is effective against me
-            
-            #NO PRIORITY THREATS: add simple points 
-            #OPPONENT 
-            if comp.find(' '+opp_checker*2+' '+' ') != -1: #'XX''
-                score -= 25
-            elif comp.find(' '+' '+opp_checker*2+' ') != -1: #''XX'
-                score -= 25
-            elif comp.find(opp_checker*2+' '+' '+' ') != -1: #XX'''
-                score -= 25
-            elif comp.find(' '+' '+' '+opp_checker*2) != -1: #'''XX
-                score -= 25
-            if comp.find(' '+opp_checker+' '+opp_checker+' ') != -1: #'X'X'
-                score -= 25
-            elif comp.find(opp_checker+' '+opp_checker+' '+' ') != -1: #X'X''
-                score -= 25
-            elif comp.find(' '+' '+opp_checker+' '+opp_checker) != -1: #''X'X
-                score -= 25
-            #ME
-            if comp.find(' '+checker*2+' '+checker+' ') != -1: #'XX'X'
-                score += 30
-            elif comp.find(' '+checker+' '+checker*2+' ') != -1: #'X'XX'
-                score += 30 
-            elif comp.find(' '+checker+' '+checker+' ') != -1: #'X'X'
-                score += 10
-            elif comp.find(checker+' '+checker+' '+' ') != -1: #X'X''
-                score += 10
-            elif comp.find(' '+' '+checker+' '+checker) != -1: #''X'X
-                score += 10
-            elif comp.find(' '+checker*2+' '+' ') != -1: #'XX''
-                score += 15
-            elif comp.find(' '+' '+checker*2+' ') != -1: #''XX'
-                score += 15
-            elif comp.find(checker*2+' '+' '+' ') != -1: #XX'''
-                score += 15
-            elif comp.find(' '+' '+' '+checker*2) != -1: #'''XX
-                score += 15
-            if comp.find(' '+checker*3+' '+' ') != -1: #'XXX''
-                score += 30
-            elif comp.find(' '+' '+checker*3+' ') != -1: #''XXX'
-                score += 30 
-            elif comp.find(checker*3+' '+' ') != -1: #XXX''
-                score += 30 
-            elif comp.find(' '+' '+checker*3) != -1: #''XXX
-                score += 30
+            score += evaluate_line(comp, checker, opp_checker, weights)
             
         return score
-    
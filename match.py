@@ -0,0 +1,217 @@
+# Headless engine-vs-engine matches
+#
+# Plays a number of games between two player factories without printing the
+# boards, spreads the games over a process pool, alternates who plays first
+# and seeds every player, then reports the aggregated results.
+#
+# Usage: python match.py PLAYER_A PLAYER_B [--games N] [--workers N]
+#                        [--seed N] [--size N] [--record FILE]
+#                        [--clock BASE+INCREMENT] [--board list|bit]
+#   where a player is 'ai', 'mcts', 'random' or 'ai:option=value,...', for example
+#   python match.py ai:time_limit=0.5,max_depth=3 random --games 20
+#   python match.py ai:weights=tuned/weights.json ai --clock 30+0.5
+import argparse
+import functools
+import math
+import multiprocessing
+import time
+
+from bitboard import BOARDS
+from gomoku import Board, RandomPlayer
+from main import AIPlayer
+from mcts import MCTSPlayer
+from records import RecordWriter
+from timecontrol import set_clocks
+
+PLAYERS = {'ai': AIPlayer, 'mcts': MCTSPlayer, 'random': RandomPlayer}
+
+
+def player_factory(spec):
+    """ returns a factory for the player described by spec, a name of
+        PLAYERS optionally followed by ':' and comma separated options, e.g.
+        'ai:time_limit=0.5,max_depth=3,ponder=True' or
+        'ai:weights=weights.json'. The factory is called as
+        factory(checker, seed=seed) and can be sent to worker processes.
+        Raises ValueError for the workers option: the games are played in
+        pool processes, which cannot start pools of their own.
+    """
+    name, _, options = spec.partition(':')
+    kwargs = {}
+    for option in options.split(','):
+        if option:
+            key, value = option.split('=')
+            if value in ('True', 'False'):
+                kwargs[key] = value == 'True'
+                continue
+            try:
+                kwargs[key] = int(value) if value.isdigit() else float(value)
+            except ValueError:
+                kwargs[key] = value
+    if 'workers' in kwargs:
+        raise ValueError('%s: the games are already played on a pool of processes, '
+                         'which cannot have children; use the --workers of the match' % spec)
+    return functools.partial(PLAYERS[name], **kwargs)
+
+
+def play_game(p1, p2, height=10, width=10, clock=None, board_class=Board):
+    """ plays one game between p1 (who moves first) and p2 without printing
+        anything, and returns the winner's checker (None for a tie), the
+        Board at the end of the game and the time taken by every move of
+        each player, as a dictionary {checker: [seconds, ...]}. With clock,
+        (base, increment) in seconds, the players get a GameClock each and
+        the one whose time runs out loses. The game is played on a
+        board_class board.
+    """
+    board = board_class(height, width)
+    p1.num_moves = 0
+    p2.num_moves = 0
+    set_clocks((p1, p2), clock)
+    latencies = {p1.checker: [], p2.checker: []}
+    try:
+        while True:
+            for player in (p1, p2):
+                start = time.perf_counter()
+                if player.clock is not None:
+                    player.clock.start()
+                move = player.next_move(board)
+                latencies[player.checker].append(time.perf_counter() - start)
+                if player.clock is not None:
+                    player.clock.stop()
+                    if player.clock.flagged:
+                        return player.opponent_checker(), board, latencies
+                board.add_checker(player.checker, move[0], move[1])
+                if board.is_win_for(player.checker, move[0], move[1]):
+                    return player.checker, board, latencies
+                elif board.is_full():
+                    return None, board, latencies
+    finally:
+        # nothing is left to ponder once the game is over
+        for player in (p1, p2):
+            if hasattr(player, 'stop_pondering'):
+                player.stop_pondering()
+
+
+def _play_match_game(task):
+    """ plays game number index of a match in a worker process. Player A
+        moves first with 'X' in the even games, player B in the odd ones.
+    """
+    factory_a, factory_b, index, seed, height, width, clock, board_class = task
+    a_first = index % 2 == 0
+    a = factory_a('X' if a_first else 'O', seed=seed * 1000003 + 2 * index)
+    b = factory_b('O' if a_first else 'X', seed=seed * 1000003 + 2 * index + 1)
+    try:
+        winner, board, latencies = play_game(a, b, height, width, clock, board_class) if a_first \
+            else play_game(b, a, height, width, clock, board_class)
+    finally:
+        for player in (a, b):
+            if hasattr(player, 'close'):
+                player.close()
+    if winner is None:
+        result = 'draw'
+    else:
+        result = 'a' if winner == a.checker else 'b'
+    moves = [(row, col) for ch, row, col in board.history]
+    on_time = any(player.clock is not None and player.clock.flagged for player in (a, b))
+    return result, winner, moves, on_time, latencies[a.checker], latencies[b.checker]
+
+
+def percentile(values, p):
+    """ returns the p-th percentile (nearest rank) of a list of numbers.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(values)))
+    return values[rank - 1]
+
+
+def run_match(factory_a, factory_b, games=10, workers=None, seed=0,
+              height=10, width=10, record=None, clock=None, board_class=Board):
+    """ plays games games between the players built by factory_a and
+        factory_b on a pool of workers processes (all the cores by default)
+        and returns a dictionary with the win/loss/draw counts, the number
+        of moves and the per-move latency percentiles of both players. The
+        games are appended to the record file record, if given, and played
+        with a clock of (base, increment) seconds per player, if given, on
+        board_class boards.
+    """
+    tasks = [(factory_a, factory_b, index, seed, height, width, clock, board_class)
+             for index in range(games)]
+    counts = {'a': 0, 'b': 0, 'draw': 0}
+    moves = []
+    time_losses = 0
+    latencies = {'a': [], 'b': []}
+    writer = None if record is None else RecordWriter(record, height, width)
+    start = time.perf_counter()
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            for result, winner, game, on_time, lat_a, lat_b in \
+                    pool.imap_unordered(_play_match_game, tasks):
+                counts[result] += 1
+                time_losses += on_time
+                moves.append(len(game))
+                latencies['a'].extend(lat_a)
+                latencies['b'].extend(lat_b)
+                if writer is not None:
+                    writer.write(game, winner)
+    finally:
+        if writer is not None:
+            writer.close()
+    report = {
+        'games': games,
+        'a_wins': counts['a'],
+        'b_wins': counts['b'],
+        'draws': counts['draw'],
+        'time_losses': time_losses,
+        'moves_total': sum(moves),
+        'moves_per_game': sum(moves) / float(games) if games else 0.0,
+        'seconds': time.perf_counter() - start,
+    }
+    for side in 'ab':
+        for p in (50, 90, 99, 100):
+            report['%s_latency_p%d' % (side, p)] = percentile(latencies[side], p)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play headless Gomoku matches.')
+    parser.add_argument('player_a')
+    parser.add_argument('player_b')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--record', metavar='FILE', help='append the games to a record file')
+    parser.add_argument('--clock', metavar='BASE+INCREMENT',
+                        help='time per player for the game and per move, e.g. 60+1')
+    parser.add_argument('--board', choices=sorted(BOARDS), default='list',
+                        help='board backend (default: list)')
+    args = parser.parse_args()
+
+    clock = None
+    if args.clock:
+        base, _, increment = args.clock.partition('+')
+        clock = (float(base), float(increment or 0))
+
+    try:
+        factory_a = player_factory(args.player_a)
+        factory_b = player_factory(args.player_b)
+    except ValueError as e:
+        parser.error(str(e))
+    report = run_match(factory_a, factory_b, args.games, args.workers, args.seed,
+                       args.size, args.size, args.record, clock, BOARDS[args.board])
+    print('A: %s  B: %s' % (args.player_a, args.player_b))
+    print('games %d: A wins %d, B wins %d, draws %d' %
+          (report['games'], report['a_wins'], report['b_wins'], report['draws']))
+    if clock is not None:
+        print('games lost on time: %d' % report['time_losses'])
+    print('moves: %d in total, %.1f per game, %.1f seconds' %
+          (report['moves_total'], report['moves_per_game'], report['seconds']))
+    for side in 'ab':
+        print('%s latency (s): p50 %.3f  p90 %.3f  p99 %.3f  max %.3f' %
+              (side.upper(), report[side + '_latency_p50'], report[side + '_latency_p90'],
+               report[side + '_latency_p99'], report[side + '_latency_p100']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+# Monte Carlo tree search player
+#
+# MCTSPlayer chooses its moves with UCT: the tree is grown one node per
+# simulation, following the children with the best upper confidence bound,
+# and every new node is scored by a random playout to the end of the game.
+# Playouts are run in batches on NumPy arrays: the boards of a batch are
+# played together, one move of every board per step, and only the lines
+# through the last move are checked for a win. The tree is kept between
+# moves, from the node of the position actually reached.
+import copy
+import math
+import time
+import numpy as np
+
+from gomoku import Player
+from timecontrol import TimeManager
+
+CODES = {'X': 1, 'O': 2}
+CHECKERS = {0: None, 1: 'X', 2: 'O'}
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+class Node:
+    """ a node of the search tree: the position after checker played move.
+    wins counts the playouts through the node won by checker (a draw
+    counts half), winner is set when the position ends the game ('X',
+    'O', or None for a full board) and terminal tells if it does.
+    """
+    __slots__ = ('move', 'checker', 'parent', 'children', 'untried',
+                 'visits', 'wins', 'terminal', 'winner')
+
+    def __init__(self, move, checker, parent):
+        self.move = move
+        self.checker = checker
+        self.parent = parent
+        self.children = {}
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+        self.terminal = False
+        self.winner = None
+
+    def uct_child(self, exploration):
+        log_visits = math.log(self.visits)
+        return max(self.children.values(),
+                   key=lambda child: child.wins / child.visits +
+                   exploration * math.sqrt(log_visits / child.visits))
+
+
+class Playouts:
+    """ random playouts on boards of a given size, given as (B, H*W) arrays
+    of cell codes (0 empty, 1 'X', 2 'O'). Every move is drawn among the
+    empty cells next to a checker.
+    """
+
+    def __init__(self, height, width):
+        self.height = height
+        self.width = width
+        self.size = height * width
+        # lines[cell, direction] lists the cells from -4 to +4 steps away
+        # from cell, the index self.size (a cell always empty) outside
+        self.lines = np.full((self.size, 4, 9), self.size, dtype=np.intp)
+        for row in range(height):
+            for col in range(width):
+                for d, (dr, dc) in enumerate(DIRECTIONS):
+                    for k in range(-4, 5):
+                        r, c = row + k * dr, col + k * dc
+                        if 0 <= r < height and 0 <= c < width:
+                            self.lines[row * width + col, d, k + 4] = r * width + c
+
+    def near(self, occupied):
+        """ returns the (B, H, W) mask of the cells next to an occupied one.
+        """
+        padded = np.pad(occupied, ((0, 0), (1, 1), (1, 1)))
+        near = np.zeros_like(occupied)
+        for dr in range(3):
+            for dc in range(3):
+                near |= padded[:, dr:dr + self.height, dc:dc + self.width]
+        return near
+
+    def run(self, cells, to_move, rng):
+        """ plays the boards of cells to the end, to_move (B,) being the
+            code of the side to move on each, and returns the (B,) codes of
+            the winners (0 for a draw).
+        """
+        count = len(cells)
+        cells = np.concatenate([cells, np.zeros((count, 1), dtype=np.int8)], axis=1)
+        player = np.array(to_move, dtype=np.int8)
+        winner = np.zeros(count, dtype=np.int8)
+        active = np.arange(count)
+        while len(active):
+            board = cells[active, :self.size]
+            occupied = (board != 0).reshape(-1, self.height, self.width)
+            empty = ~occupied
+            candidates = (self.near(occupied) & empty).reshape(len(active), -1)
+            alone = ~candidates.any(axis=1)
+            candidates[alone] = empty.reshape(len(active), -1)[alone]
+            # full boards are draws
+            active = active[candidates.any(axis=1)]
+            candidates = candidates[candidates.any(axis=1)]
+            if not len(active):
+                break
+            scores = rng.random(candidates.shape)
+            scores[~candidates] = -1.0
+            moves = scores.argmax(axis=1)
+            p = player[active]
+            cells[active, moves] = p
+            # runs of the mover on both sides of the move, in every direction
+            same = cells[active[:, None, None], self.lines[moves]] == p[:, None, None]
+            before = np.cumprod(same[:, :, 3::-1], axis=2).sum(axis=2)
+            after = np.cumprod(same[:, :, 5:], axis=2).sum(axis=2)
+            won = (before + after + 1 >= 5).any(axis=1)
+            winner[active[won]] = p[won]
+            player[active] = 3 - p
+            active = active[~won]
+        return winner
+
+
+class MCTSPlayer(Player):
+    """ a subclass of Player choosing its moves by Monte Carlo tree search,
+    within time_limit seconds per move. batch playouts are run together,
+    and exploration is the UCT constant. With clock, the timecontrol.GameClock
+    of a timed game, every move gets the soft limit its TimeManager allocates
+    instead of time_limit.
+    """
+
+    def __init__(self, checker, time_limit=5.0, batch=32, exploration=1.4, seed=None, clock=None):
+        Player.__init__(self, checker, seed)
+        self.time_limit = time_limit
+        self.clock = clock
+        self.time_manager = None
+        self.batch = batch
+        self.exploration = exploration
+        self.np_rng = np.random.default_rng(self.rng.getrandbits(64))
+        self.root = None
+        self.root_len = 0
+        self.playouts = None
+        self.simulations = 0
+
+    def candidates(self, board):
+        """ returns the moves considered on board, in a random order.
+        """
+        moves = sorted(board.frontier)
+        if not moves:
+            moves = [(board.height // 2, board.width // 2)]
+        self.rng.shuffle(moves)
+        return moves
+
+    def reuse_root(self, board):
+        """ returns the node of the tree for the position of board, reached
+            from the root through the moves played since, or a new root.
+        """
+        node = self.root
+        if node is not None and len(board.history) >= self.root_len:
+            for checker, row, col in board.history[self.root_len:]:
+                node = node.children.get((row, col))
+                if node is None or node.checker != checker:
+                    node = None
+                    break
+        if node is None:
+            last = board.last_move()
+            node = Node(None if last is None else (last[1], last[2]),
+                        self.opponent_checker(), None)
+        node.parent = None
+        return node
+
+    def select(self, board, cells, root):
+        """ walks down from root to a node to simulate, expanding one new
+            node if possible, and plays the moves on board and cells.
+            returns the node and the number of moves played. Visits are
+            counted on the way down, so that the simulations of a batch
+            spread over the tree.
+        """
+        node = root
+        node.visits += 1
+        played = 0
+        while not node.terminal:
+            if node.untried is None:
+                node.untried = self.candidates(board)
+            if node.untried:
+                move = node.untried.pop()
+                checker = 'O' if node.checker == 'X' else 'X'
+                child = Node(move, checker, node)
+                node.children[move] = child
+                node = child
+            elif node.children:
+                node = node.uct_child(self.exploration)
+            else:
+                break
+            board.add_checker(node.checker, node.move[0], node.move[1])
+            cells[node.move[0] * board.width + node.move[1]] = CODES[node.checker]
+            played += 1
+            node.visits += 1
+            if node.visits == 1:
+                if board.is_win_for(node.checker, node.move[0], node.move[1]):
+                    node.terminal = True
+                    node.winner = node.checker
+                elif board.is_full():
+                    node.terminal = True
+                break
+        return node, played
+
+    @staticmethod
+    def backpropagate(node, winner):
+        while node is not None:
+            if winner == node.checker:
+                node.wins += 1.0
+            elif winner is None:
+                node.wins += 0.5
+            node = node.parent
+
+    def next_move(self, board):
+        """ returns the called MCTSPlayer's next move for a game on the
+            specified Board object, after searching for time_limit seconds
+            (or the time allocated by the clock of a timed game).
+        """
+        start = time.time()
+        self.num_moves += 1
+        assert(board.is_full() == False)
+        #The search has no depths to stop between: it runs for the soft
+        #limit of the move
+        time_limit = self.time_limit
+        if self.clock is not None:
+            if self.time_manager is None or self.time_manager.clock is not self.clock:
+                self.time_manager = TimeManager(self.clock)
+            time_limit = self.time_manager.allocate(board, self.num_moves)[0]
+        if self.playouts is None or self.playouts.size != board.height * board.width:
+            self.playouts = Playouts(board.height, board.width)
+            self.root = None
+        root = self.reuse_root(board)
+        work = copy.deepcopy(board)
+        cells = np.array([CODES.get(ch, 0) for row in board.slots for ch in row],
+                         dtype=np.int8)
+        self.simulations = 0
+
+        while time.time() < start + time_limit or not root.children:
+            leaves = []
+            for i in range(self.batch):
+                node, played = self.select(work, cells, root)
+                if node.terminal:
+                    self.backpropagate(node, node.winner)
+                else:
+                    leaves.append((node, cells.copy(), 3 - CODES[node.checker]))
+                for k in range(played):
+                    ch, row, col = work.undo()
+                    cells[row * work.width + col] = 0
+            if leaves:
+                winners = self.playouts.run(np.array([leaf[1] for leaf in leaves]),
+                                            [leaf[2] for leaf in leaves], self.np_rng)
+                for (node, leaf_cells, to_move), code in zip(leaves, winners):
+                    self.backpropagate(node, CHECKERS[int(code)])
+            self.simulations += self.batch
+
+        #A winning move is played at once, otherwise the most visited one
+        best = max(root.children.values(),
+                   key=lambda child: (child.winner == self.checker, child.visits))
+        self.root = best
+        self.root_len = len(board.history) + 1
+        return best.move
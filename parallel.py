@@ -0,0 +1,114 @@
+# Parallel root search for the AI player
+#
+# The moves at the root of the search are shared out between the processes
+# of a pool. Every worker keeps its own AIPlayer (and transposition table)
+# for as long as the pool lives, and all of them read and raise a shared
+# alpha, so that a root move no better than the best one found so far by any
+# worker is still cut off early.
+#
+# Every search of the pool gets a new number, kept in shared memory next to
+# the alpha and under its lock. A task of an older search, left queued when
+# that search ran out of time, returns at once without searching, and it
+# never raises the alpha of the current one.
+import math
+import multiprocessing
+import time
+
+# state of a worker process
+_worker = {}
+
+
+def _init_worker(alpha, current):
+    _worker['alpha'] = alpha
+    _worker['current'] = current
+    _worker['player'] = None
+    _worker['search_id'] = None
+
+
+def _search_root_move(task):
+    """ searches one root move in a worker and returns its score, or None
+        if the deadline passed first or the search it belongs to is over.
+    """
+    # main imports this module
+    import main
+    (checker, tt_size_mb, weights, search_id, number, board_class, height, width,
+     radius, history, move, depth, deadline) = task
+    shared_alpha = _worker['alpha']
+    current = _worker['current']
+    with shared_alpha.get_lock():
+        if current.value != number:
+            return None
+        alpha = shared_alpha.value
+    if time.time() >= deadline:
+        return None
+    player = _worker['player']
+    if player is None or player.checker != checker or player.weights != weights:
+        player = main.AIPlayer(checker, tt_size_mb=tt_size_mb, weights=weights)
+        _worker['player'] = player
+    if _worker['search_id'] != search_id:
+        player.start_search()
+        _worker['search_id'] = search_id
+
+    board = board_class(height, width, radius)
+    for ch, row, col in history:
+        board.add_checker(ch, row, col)
+    player.evaluator = main.LineEvaluator(board, checker, player.opponent_checker(), weights)
+    player.root_len = len(board.history)
+    player.deadline = deadline
+    player.nodes = 0
+
+    try:
+        val = player.minimax(player, checker, move, board, depth, alpha, math.inf, False)
+    except main.SearchTimeout:
+        return None
+    with shared_alpha.get_lock():
+        if current.value == number and val > shared_alpha.value:
+            shared_alpha.value = val
+    return val
+
+
+class RootSearchPool:
+    """ a pool of worker processes searching the root moves of an AIPlayer.
+    With a single worker the moves are searched one after the other with the
+    same alphas as the serial search, so the scores are the same.
+    """
+
+    def __init__(self, workers):
+        ctx = multiprocessing.get_context()
+        self.alpha = ctx.Value('d', -math.inf)
+        # the number of the current search, guarded by the alpha's lock
+        self.current = ctx.Value('q', 0, lock=False)
+        self.pool = ctx.Pool(workers, initializer=_init_worker,
+                             initargs=(self.alpha, self.current))
+
+    def search(self, player, board, open_pos, depth, deadline):
+        """ searches every move of open_pos for player to the given depth and
+            returns their scores as a dictionary. Raises main.SearchTimeout
+            if the deadline passed before all of them were searched.
+        """
+        import main
+        number = self.next_search()
+        search_id = (id(player), player.num_moves)
+        tasks = [(player.checker, player.tt_size_mb, player.weights, search_id, number,
+                  type(board), board.height, board.width, board.radius,
+                  list(board.history), move, depth, deadline) for move in open_pos]
+        scores = {}
+        for move, val in zip(open_pos, self.pool.imap(_search_root_move, tasks)):
+            if val is None:
+                # the tasks still queued see the search is over and return
+                self.next_search()
+                raise main.SearchTimeout()
+            scores[move] = val
+        return scores
+
+    def next_search(self):
+        """ starts a new search, with its own alpha, and returns its number.
+        """
+        with self.alpha.get_lock():
+            self.current.value += 1
+            self.alpha.value = -math.inf
+            return self.current.value
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
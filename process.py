@@ -3,38 +3,63 @@
 
 from gomoku import Board, Player
 from main import *
+from timecontrol import set_clocks
 
-def process_move(player, board):
+def process_move(player, board, verbose=True):
     """ Process the next move by the specified player using the
         specified board.
         inputs: player is an instance of the Player class or one of its
                   subclasses.
                 board is a Board object.
+                verbose is False to play without printing anything.
     """
-    print(str(player) + "'s turn")
+    if verbose:
+        print(str(player) + "'s turn")
  
+    if player.clock is not None:
+        player.clock.start()
     move = player.next_move(board)
+    if player.clock is not None:
+        player.clock.stop()
+        if player.clock.flagged:
+            if verbose:
+                print(player, 'loses on time.')
+            return True
     
     board.add_checker(player.checker, move[0], move[1])
-    print()
-    print(board)
+    if verbose:
+        print()
+        print(board)
+        if player.clock is not None:
+            print('Time left:', player.clock)
 
     if board.is_win_for(player.checker, move[0], move[1]):
-        print(player, 'wins in', player.num_moves, 'moves.')
-        print('Congratulations!')
+        if verbose:
+            print(player, 'wins in', player.num_moves, 'moves.')
+            print('Congratulations!')
         return True
     elif board.is_full():
-        print("It's a tie!")
+        if verbose:
+            print("It's a tie!")
         return True
     else:
         return False
     
-def gomoku(p1, p2):
+def gomoku(p1, p2, verbose=True, height=10, width=10, clock=None, board_class=Board):
     """ Plays the Gomoku between the two specified players,
         and returns the Board object as it looks at the end of the game.
         inputs: p1 and p2 are objects representing players 
           One player should use 'X' checkers and the other should
           use 'O' checkers.
+          verbose is False to play without printing anything.
+          height and width are the size of the board (15x15 and 19x19
+          are the standard ones).
+          clock is (base, increment) in seconds for a timed game: each
+          player gets a GameClock, and the one whose time runs out loses.
+          Without it the players have no clock, even if they had one in
+          an earlier game.
+          board_class is the Board class to play on, e.g.
+          bitboard.BitBoard.
     """
     # Make sure one player is 'X' and one player is 'O'.
     if p1.checker not in 'XO' or p2.checker not in 'XO' \
@@ -42,17 +67,25 @@ def gomoku(p1, p2):
         print('need one X player and one O player.')
         return None
 
-    print('Welcome to Gomoku!')
-    print()
-    b = Board(10,10)
-    print(b)
+    b = board_class(height,width)
+    if verbose:
+        print('Welcome to Gomoku!')
+        print()
+        print(b)
     p1.num_moves = 0
     p2.num_moves = 0
+    set_clocks((p1, p2), clock)
     
-    while True:
-        if process_move(p1, b) == True:
-            return b
+    try:
+        while True:
+            if process_move(p1, b, verbose) == True:
+                return b
 
-        if process_move(p2, b) == True:
-            return b
+            if process_move(p2, b, verbose) == True:
+                return b
+    finally:
+        # nothing is left to ponder once the game is over
+        for player in (p1, p2):
+            if hasattr(player, 'stop_pondering'):
+                player.stop_pondering()
 
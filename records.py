@@ -0,0 +1,285 @@
+# Game records
+#
+# Games are stored in append-only record files, one byte per move on boards
+# of up to 256 cells (16x16) and two bytes on larger ones. Files are read
+# and written as streams, one game at a time, so that files of millions of
+# games are never loaded whole.
+#
+# File format (little endian): a header '<4sHBB' (RECORD_MAGIC,
+# RECORD_VERSION, height, width) followed by the games, each one a header
+# '<BH' (flags, number of moves) and its moves as row * width + col, in
+# 'B' or '<H' depending on the board size. The flags hold the result in
+# their two low bits (RESULTS) and the first player in the next one (set
+# when 'O' moved first).
+#
+# Usage: python records.py info FILE
+#        python records.py analyze FILE [--plies P,P,...] [--search]
+#                          [--depth N] [--time-limit S] [--workers N]
+#                          [--output FILE]
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import struct
+import sys
+
+from gomoku import Board
+
+RECORD_MAGIC = b'GMKR'
+RECORD_VERSION = 1
+HEADER = struct.Struct('<4sHBB')
+GAME = struct.Struct('<BH')
+# result flags of a game: not finished, won by 'X', won by 'O', drawn
+RESULTS = {'?': 0, 'X': 1, 'O': 2, None: 3}
+RESULT_NAMES = {code: result for result, code in RESULTS.items()}
+FIRST_O = 4
+
+# a game read from a record file: the checker who moved first, the result
+# ('X', 'O', None for a draw or '?' for a game not finished) and the moves
+# as (row, col)
+GameRecord = collections.namedtuple('GameRecord', 'first result moves')
+
+
+def _move_format(height, width):
+    return 'B' if height * width <= 256 else '<H'
+
+
+class RecordWriter:
+    """ appends games to a record file of boards of the given size, which
+    is created if needed. The file must hold games of the same size.
+    """
+
+    def __init__(self, path, height=10, width=10):
+        self.height = height
+        self.width = width
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(RECORD_MAGIC, RECORD_VERSION, height, width))
+        else:
+            with open(path, 'rb') as f:
+                header = _read_header(f, path)
+            if header != (height, width):
+                self.file.close()
+                raise ValueError('%s holds games on %dx%d boards' % ((path,) + header))
+        self.move = struct.Struct(_move_format(height, width))
+
+    def write(self, moves, result='?', first='X'):
+        """ appends a game: its moves as (row, col), its result ('X', 'O',
+            None for a draw or '?') and the checker who moved first.
+        """
+        flags = RESULTS[result] | (FIRST_O if first == 'O' else 0)
+        data = bytearray(GAME.pack(flags, len(moves)))
+        for row, col in moves:
+            data += self.move.pack(row * self.width + col)
+        self.file.write(data)
+
+    def write_board(self, board, result='?'):
+        """ appends the game played on board.
+        """
+        first = board.history[0][0] if board.history else 'X'
+        self.write([(row, col) for ch, row, col in board.history], result, first)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_header(f, path):
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError('%s is not a record file' % path)
+    magic, version, height, width = HEADER.unpack(data)
+    if magic != RECORD_MAGIC or version != RECORD_VERSION:
+        raise ValueError('%s is not a record file' % path)
+    return height, width
+
+
+class RecordReader:
+    """ reads the games of a record file one after the other: iterating
+    over it yields GameRecord tuples. height and width are the board size
+    of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb', buffering=1 << 16)
+        try:
+            self.height, self.width = _read_header(self.file, path)
+        except ValueError:
+            self.file.close()
+            raise
+        self.move_format = _move_format(self.height, self.width)
+
+    def __iter__(self):
+        width = self.width
+        size = struct.calcsize(self.move_format)
+        while True:
+            data = self.file.read(GAME.size)
+            if not data:
+                return
+            if len(data) < GAME.size:
+                raise ValueError('%s is truncated' % self.path)
+            flags, count = GAME.unpack(data)
+            data = self.file.read(count * size)
+            if len(data) < count * size:
+                raise ValueError('%s is truncated' % self.path)
+            if size == 1:
+                cells = data
+            else:
+                cells = struct.unpack('<%dH' % count, data)
+            yield GameRecord('O' if flags & FIRST_O else 'X', RESULT_NAMES[flags & 3],
+                             [divmod(cell, width) for cell in cells])
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def replay(record, height, width, plies=None):
+    """ returns the Board after the first plies moves of a GameRecord (all
+        of them by default).
+    """
+    board = Board(height, width)
+    checker = record.first
+    for row, col in record.moves[:plies]:
+        board.add_checker(checker, row, col)
+        checker = 'O' if checker == 'X' else 'X'
+    return board
+
+
+# AIPlayer of every checker in a worker process
+_players = {}
+
+
+def _analyze_game(task):
+    """ analyses the chosen plies of one game in a worker process and
+        returns one result per ply: the static evaluation for the player to
+        move, or the move and score of a short search.
+    """
+    # main imports the evaluation tables, loaded once per worker
+    import main
+    index, record, height, width, plies, search, depth, time_limit = task
+    # nothing learnt from the games analysed before is carried over, so the
+    # results do not depend on how the games are shared out
+    for player in _players.values():
+        player.new_game()
+    results = []
+    board = Board(height, width)
+    checker = record.first
+    wanted = set(range(len(record.moves) + 1) if plies is None else plies)
+    for ply in range(len(record.moves) + 1):
+        if ply in wanted:
+            opp = 'O' if checker == 'X' else 'X'
+            result = {'game': index, 'ply': ply, 'to_move': checker}
+            if search and ply < len(record.moves):
+                player = _players.get(checker)
+                if player is None:
+                    player = main.AIPlayer(checker, time_limit=time_limit,
+                                           max_depth=depth, seed=0, stats=True)
+                    _players[checker] = player
+                player.num_moves = ply // 2
+                move = player.next_move(board)
+                result.update(move=list(move), score=player.last_stats.score,
+                              played=list(record.moves[ply]))
+            else:
+                result['eval'] = main.AIPlayer.static_eval(board, checker, opp)
+            results.append(result)
+        if ply == len(record.moves):
+            break
+        row, col = record.moves[ply]
+        board.add_checker(checker, row, col)
+        checker = 'O' if checker == 'X' else 'X'
+    return results
+
+
+def bounded_imap(pool, func, tasks, window):
+    """ yields func(task) for every task in order, computed on pool with at
+        most window tasks submitted at a time, so that tasks is consumed
+        as the results are.
+    """
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def analyze(path, plies=None, search=False, depth=3, time_limit=1.0, workers=None):
+    """ yields the analysis of the games of a record file, one dictionary
+        per ply: at the given plies (all of them by default), the static
+        evaluation for the player to move, or with search the move and
+        score found in time_limit seconds and up to depth plies. The games
+        are analysed on a pool of workers processes (all the cores by
+        default) as they are read.
+    """
+    reader = RecordReader(path)
+    tasks = ((index, record, reader.height, reader.width, plies, search, depth, time_limit)
+             for index, record in enumerate(reader))
+    workers = workers or os.cpu_count()
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            for results in bounded_imap(pool, _analyze_game, tasks, 4 * workers):
+                for result in results:
+                    yield result
+    finally:
+        reader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or analyse Gomoku game records.')
+    parser.add_argument('command', choices=['info', 'analyze'])
+    parser.add_argument('path')
+    parser.add_argument('--plies', default=None,
+                        help='comma separated plies to analyse (all by default)')
+    parser.add_argument('--search', action='store_true',
+                        help='search the positions instead of evaluating them')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--time-limit', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        games = 0
+        moves = 0
+        results = collections.Counter()
+        with RecordReader(args.path) as reader:
+            for record in reader:
+                games += 1
+                moves += len(record.moves)
+                results[record.result] += 1
+        print('%s: %dx%d board, %d games, %d moves' %
+              (args.path, reader.height, reader.width, games, moves))
+        print('X wins %d, O wins %d, draws %d, unfinished %d' %
+              (results['X'], results['O'], results[None], results['?']))
+        return
+
+    plies = None if args.plies is None else [int(p) for p in args.plies.split(',')]
+    out = sys.stdout if args.output is None else open(args.output, 'w')
+    try:
+        for result in analyze(args.path, plies, args.search, args.depth,
+                              args.time_limit, args.workers):
+            out.write(json.dumps(result) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
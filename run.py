@@ -1,9 +1,16 @@
+import sys
 from gomoku import Player, RandomPlayer
 from process import gomoku
 from main import AIPlayer 
+from bitboard import BOARDS
+
+#Board size as first argument, e.g. python run.py 15 (10 by default), and
+#the board backend as second one, 'list' (the default) or 'bit'
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+board_class = BOARDS[sys.argv[2] if len(sys.argv) > 2 else 'list']
 
 opp = AIPlayer('O')
 player = Player('X')
 
-#gomoku(player, opp)
-gomoku(opp, player)
+#gomoku(player, opp, height=size, width=size, board_class=board_class)
+gomoku(opp, player, height=size, width=size, board_class=board_class)
@@ -0,0 +1,361 @@
+# Game server hosting many games against the AI player
+#
+# An asyncio server speaking a line-based JSON protocol over TCP or a Unix
+# socket. Every session owns its Board; the engine moves of all the sessions
+# are searched on one shared pool of processes, so the event loop only
+# parses requests and never blocks on a search. The pool is bounded: at
+# most max_queue engine moves wait for a worker, and a move asked for
+# beyond that is refused at once with a 'busy' error instead of queueing
+# without limit. Every engine move has a deadline, from which its search
+# time is cut down.
+#
+# Requests and responses are JSON objects, one per line. A request may
+# carry an 'id', echoed in its response; responses hold 'ok' and either
+# the result fields or 'error'. Requests of one connection are served
+# concurrently, the moves of one session one after the other.
+#   {"op": "new", "size": 10, "engine": "O", "time_limit": 1.0, "max_depth": 8}
+#       starts a game against the engine playing 'engine' ('X' moves
+#       first, so the engine's first move comes with the response); the
+#       time limit and depth are capped by the server's
+#   {"op": "move", "session": 1, "row": 4, "col": 5}
+#       plays a move and returns the engine's reply, if the game goes on
+#   {"op": "state", "session": 1}
+#   {"op": "close", "session": 1}
+#   {"op": "metrics"}
+#       returns the sessions, the queue depth, the searches running and
+#       the per-move latency percentiles
+#
+# Usage: python server.py [--host H] [--port N] [--unix PATH] [--workers N]
+#                         [--max-queue N] [--max-sessions N]
+#                         [--time-limit S] [--deadline S]
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import multiprocessing
+import time
+
+from gomoku import Board
+from match import percentile
+
+# deepest search a session may ask for
+MAX_DEPTH = 8
+
+# AIPlayer of every (checker, max_depth) in a worker process, with the
+# session it last searched for; max_depth is bounded, and so is the cache
+_players = {}
+
+
+def _init_worker():
+    # compile or load the line tables once per worker
+    import evaluation
+    for length in range(1, evaluation.TABLE_MAX_LENGTH + 1):
+        evaluation.line_table(length)
+
+
+def _engine_move(task):
+    """ searches the engine's move in a worker process and returns it with
+        the seconds the search took.
+    """
+    import main
+    session_id, height, width, history, checker, time_limit, max_depth = task
+    key = (checker, max_depth)
+    if key not in _players:
+        _players[key] = (None, main.AIPlayer(checker, time_limit=time_limit,
+                                             max_depth=max_depth, seed=0))
+    last_session, player = _players[key]
+    if last_session != session_id:
+        # the tables of another game would only mislead the search
+        player.new_game()
+        _players[key] = (session_id, player)
+    player.time_limit = time_limit
+    board = Board(height, width)
+    for ch, row, col in history:
+        board.add_checker(ch, row, col)
+    player.num_moves = sum(1 for ch, row, col in history if ch == checker)
+    start = time.perf_counter()
+    move = player.next_move(board)
+    return move, time.perf_counter() - start
+
+
+class ServerError(Exception):
+    """ an error reported to the client as the response to its request.
+    """
+
+
+class Session:
+    """ one game against the engine: its board, the engine's checker and
+    search options, and the winner once the game is over ('X', 'O', or
+    None for a tie).
+    """
+
+    def __init__(self, session_id, height, width, engine, time_limit, max_depth):
+        self.id = session_id
+        self.board = Board(height, width)
+        self.engine = engine
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.over = False
+        self.winner = None
+        # the moves of a session are played one at a time
+        self.lock = asyncio.Lock()
+
+    def to_move(self):
+        last = self.board.last_move()
+        return 'X' if last is None or last[0] == 'O' else 'O'
+
+    def play(self, checker, row, col):
+        """ plays checker at (row, col) and records the end of the game.
+        """
+        if self.over:
+            raise ServerError('the game is over')
+        if not self.board.can_add_to(row, col):
+            raise ServerError('cannot play at %d,%d' % (row, col))
+        self.board.add_checker(checker, row, col)
+        if self.board.is_win_for(checker, row, col):
+            self.over = True
+            self.winner = checker
+        elif self.board.is_full():
+            self.over = True
+
+    def state(self):
+        return {'session': self.id, 'height': self.board.height,
+                'width': self.board.width, 'engine': self.engine,
+                'moves': [list(move) for move in self.board.history],
+                'to_move': None if self.over else self.to_move(),
+                'over': self.over, 'winner': self.winner}
+
+
+class GameServer:
+    """ the sessions and the engine pool of a server. workers processes
+    search the engine moves (all the cores by default), max_queue moves at
+    most wait for one of them, and every move must be found within
+    deadline seconds, its search being given no more than time_limit.
+    """
+
+    def __init__(self, workers=None, max_queue=64, max_sessions=1000,
+                 time_limit=1.0, deadline=5.0):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_queue = max_queue
+        self.max_sessions = max_sessions
+        self.time_limit = time_limit
+        self.deadline = deadline
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context(),
+            initializer=_init_worker)
+        self.slots = asyncio.Semaphore(self.workers)
+        self.sessions = {}
+        self.ids = itertools.count(1)
+        # engine moves waiting for a worker, and being searched
+        self.queued = 0
+        self.running = 0
+        self.served = 0
+        self.rejected = 0
+        self.timeouts = 0
+        # seconds from the request to the engine's move, and of the search
+        self.latencies = collections.deque(maxlen=10000)
+        self.search_times = collections.deque(maxlen=10000)
+
+    async def engine_move(self, session):
+        """ searches and plays the engine's move in session, and returns it.
+            Raises ServerError if the queue is full, the deadline passed or
+            the search failed.
+            The time spent waiting for a worker is taken from the search.
+        """
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise ServerError('busy')
+        start = time.perf_counter()
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.deadline)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ServerError('timeout')
+        finally:
+            self.queued -= 1
+        remaining = self.deadline - (time.perf_counter() - start)
+        # leave the search some room to stop and send its move back
+        time_limit = min(session.time_limit, remaining * 0.8)
+        task = (session.id, session.board.height, session.board.width,
+                list(session.board.history), session.engine, time_limit,
+                session.max_depth)
+        try:
+            future = self.pool.submit(_engine_move, task)
+        except (concurrent.futures.process.BrokenProcessPool, RuntimeError):
+            self.slots.release()
+            raise ServerError('engine unavailable')
+        self.running += 1
+        # the worker is given back when the search ends, even if the
+        # deadline passed before
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(self.search_done))
+        try:
+            move, seconds = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), remaining)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise ServerError('timeout')
+        except concurrent.futures.process.BrokenProcessPool:
+            raise ServerError('engine unavailable')
+        except Exception as e:
+            raise ServerError('engine error: %s' % e)
+        session.play(session.engine, move[0], move[1])
+        self.served += 1
+        self.latencies.append(time.perf_counter() - start)
+        self.search_times.append(seconds)
+        return list(move)
+
+    def search_done(self):
+        self.running -= 1
+        self.slots.release()
+
+    def session(self, request):
+        session = self.sessions.get(request.get('session'))
+        if session is None:
+            raise ServerError('no session %s' % request.get('session'))
+        return session
+
+    async def op_new(self, request):
+        if len(self.sessions) >= self.max_sessions:
+            raise ServerError('too many sessions')
+        size = int(request.get('size', 10))
+        engine = request.get('engine', 'O')
+        if engine not in ('X', 'O') or not 5 <= size <= 25:
+            raise ServerError('invalid game')
+        time_limit = min(float(request.get('time_limit', self.time_limit)), self.time_limit)
+        max_depth = min(max(int(request.get('max_depth', MAX_DEPTH)), 1), MAX_DEPTH)
+        session = Session(next(self.ids), size, size, engine, time_limit, max_depth)
+        self.sessions[session.id] = session
+        response = {'session': session.id}
+        if engine == 'X':
+            try:
+                response['engine_move'] = await self.engine_move(session)
+            except ServerError:
+                del self.sessions[session.id]
+                raise
+        return response
+
+    async def op_move(self, request):
+        session = self.session(request)
+        async with session.lock:
+            if session.to_move() == session.engine:
+                raise ServerError('not your turn')
+            session.play(session.to_move(), int(request['row']), int(request['col']))
+            response = {}
+            if not session.over:
+                try:
+                    response['engine_move'] = await self.engine_move(session)
+                except Exception:
+                    # without a reply the move is taken back, to be sent again
+                    session.board.undo()
+                    raise
+            response.update(over=session.over, winner=session.winner)
+            return response
+
+    async def op_state(self, request):
+        return self.session(request).state()
+
+    async def op_close(self, request):
+        del self.sessions[self.session(request).id]
+        return {}
+
+    async def op_metrics(self, request):
+        metrics = {'sessions': len(self.sessions), 'workers': self.workers,
+                   'queued': self.queued, 'running': self.running,
+                   'served': self.served, 'rejected': self.rejected,
+                   'timeouts': self.timeouts}
+        for p in (50, 90, 99, 100):
+            metrics['latency_p%d' % p] = percentile(list(self.latencies), p)
+            metrics['search_p%d' % p] = percentile(list(self.search_times), p)
+        return metrics
+
+    async def handle_request(self, line):
+        """ returns the response to one request line, as a dictionary.
+        """
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError('a request must be an object')
+        except ValueError as e:
+            return {'ok': False, 'error': 'invalid request: %s' % e}
+        response = {'id': request['id']} if 'id' in request else {}
+        handler = getattr(self, 'op_%s' % request.get('op'), None)
+        try:
+            if handler is None:
+                raise ServerError('unknown op %s' % request.get('op'))
+            response.update(await handler(request))
+            response['ok'] = True
+        except ServerError as e:
+            response.update(ok=False, error=str(e))
+        except (KeyError, TypeError, ValueError) as e:
+            response.update(ok=False, error='invalid request: %s' % e)
+        return response
+
+    async def handle_client(self, reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = set()
+
+        async def serve(line):
+            response = await self.handle_request(line)
+            async with write_lock:
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(serve(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def serve(server, host='127.0.0.1', port=8765, unix=None):
+    if unix:
+        listener = await asyncio.start_unix_server(server.handle_client, unix)
+        print('serving on', unix)
+    else:
+        listener = await asyncio.start_server(server.handle_client, host, port)
+        print('serving on %s:%d' % (host, port))
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Gomoku games against the engine.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-queue', type=int, default=64)
+    parser.add_argument('--max-sessions', type=int, default=1000)
+    parser.add_argument('--time-limit', type=float, default=1.0)
+    parser.add_argument('--deadline', type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = GameServer(args.workers, args.max_queue, args.max_sessions,
+                        args.time_limit, args.deadline)
+    try:
+        asyncio.run(serve(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+# Search statistics for the AI player
+#
+# An AIPlayer created with stats=True (or with a callable, such as a
+# JsonLinesSink) fills a SearchStats object on every next_move call. The
+# counters are collected by wrappers installed on the player's hot methods
+# for the duration of the move only, so a player without stats runs the
+# plain methods and pays nothing for them.
+import json
+import time
+
+
+class SearchStats:
+    """ statistics of one AIPlayer.next_move call: nodes visited (per ply
+    too), leaf evaluations, alpha-beta cutoffs, transposition table hits,
+    seconds spent in evaluation and in move generation, one record per
+    completed depth and the move chosen with its score. With a worker pool
+    the search runs in other processes and only the per-depth records and
+    the result are filled in.
+    """
+
+    def __init__(self, checker, move_number):
+        self.checker = checker
+        self.move_number = move_number
+        self.nodes = 0
+        self.evals = 0
+        self.cutoffs = 0
+        self.tt_hits = 0
+        # ply_nodes[p] nodes were visited p plies below the root moves in
+        # the depth being searched
+        self.ply_nodes = []
+        self.eval_time = 0.0
+        self.movegen_time = 0.0
+        self.depths = []
+        self.forced = None
+        # work of earlier searches carried on: {'source': 'ponder' or
+        # 'tree', 'depth': last depth known}, or None
+        self.reused = None
+        self.candidates = 0
+        self.move = None
+        self.score = None
+        self.seconds = 0.0
+
+    @staticmethod
+    def branching_of(ply_nodes):
+        """ returns the effective branching factor below every ply: the
+            number of nodes of the next ply per node of this one.
+        """
+        return [ply_nodes[p + 1] / float(ply_nodes[p])
+                for p in range(len(ply_nodes) - 1) if ply_nodes[p]]
+
+    def branching(self):
+        """ returns the branching factors of the deepest completed depth.
+        """
+        return self.depths[-1]['branching'] if self.depths else []
+
+    def add_depth(self, depth, seconds, move, score):
+        """ records a completed depth of the iterative deepening and starts
+            counting the nodes per ply of the next one.
+        """
+        self.depths.append({'depth': depth, 'nodes': self.nodes,
+                            'seconds': seconds, 'move': move, 'score': score,
+                            'ply_nodes': list(self.ply_nodes),
+                            'branching': self.branching_of(self.ply_nodes)})
+        del self.ply_nodes[:]
+
+    def as_dict(self):
+        """ returns the statistics as a dictionary of plain values, ready
+            to be written as JSON.
+        """
+        return {
+            'checker': self.checker,
+            'move_number': self.move_number,
+            'move': self.move,
+            'score': self.score,
+            'seconds': self.seconds,
+            'candidates': self.candidates,
+            'forced': self.forced,
+            'reused': self.reused,
+            'nodes': self.nodes,
+            'evals': self.evals,
+            'cutoffs': self.cutoffs,
+            'tt_hits': self.tt_hits,
+            'branching': self.branching(),
+            'eval_time': self.eval_time,
+            'movegen_time': self.movegen_time,
+            'depths': list(self.depths),
+        }
+
+    def __repr__(self):
+        return 'SearchStats(%s)' % self.as_dict()
+
+
+class JsonLinesSink:
+    """ a stats callback writing every SearchStats it receives as one JSON
+    line, to a path (appended to) or an open text file.
+    """
+
+    def __init__(self, target):
+        if hasattr(target, 'write'):
+            self.file = target
+            self.owned = False
+        else:
+            self.file = open(target, 'a')
+            self.owned = True
+
+    def __call__(self, stats):
+        self.file.write(json.dumps(stats.as_dict()) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+
+class _TimedEvaluator:
+    """ a LineEvaluator proxy counting leaf evaluations and the time spent
+    keeping the evaluation up to date.
+    """
+
+    def __init__(self, evaluator, stats):
+        self.evaluator = evaluator
+        self.stats = stats
+
+    def add_checker(self, checker, row, col):
+        start = time.perf_counter()
+        self.evaluator.add_checker(checker, row, col)
+        self.stats.eval_time += time.perf_counter() - start
+
+    def undo(self):
+        start = time.perf_counter()
+        self.evaluator.undo()
+        self.stats.eval_time += time.perf_counter() - start
+
+    def score(self):
+        self.stats.evals += 1
+        return self.evaluator.score()
+
+
+def instrument(player, stats):
+    """ makes player record its search in stats until uninstrument(player)
+        is called, by shadowing its minimax, order_moves and record_cutoff
+        methods with counting wrappers.
+    """
+    minimax = player.minimax
+    order_moves = player.order_moves
+    record_cutoff = player.record_cutoff
+    ply_nodes = stats.ply_nodes
+    hits = player.tt.hits
+
+    def counted_minimax(p, ch, move, board, *args):
+        if not isinstance(player.evaluator, _TimedEvaluator):
+            player.evaluator = _TimedEvaluator(player.evaluator, stats)
+        ply = len(board.history) - player.root_len
+        while len(ply_nodes) <= ply:
+            ply_nodes.append(0)
+        ply_nodes[ply] += 1
+        stats.nodes += 1
+        try:
+            return minimax(p, ch, move, board, *args)
+        finally:
+            stats.tt_hits = player.tt.hits - hits
+
+    def timed_order_moves(*args):
+        start = time.perf_counter()
+        moves = order_moves(*args)
+        stats.movegen_time += time.perf_counter() - start
+        return moves
+
+    def counted_record_cutoff(*args):
+        stats.cutoffs += 1
+        record_cutoff(*args)
+
+    player.minimax = counted_minimax
+    player.order_moves = timed_order_moves
+    player.record_cutoff = counted_record_cutoff
+
+
+def uninstrument(player):
+    """ gives player back its plain search methods.
+    """
+    for name in ('minimax', 'order_moves', 'record_cutoff'):
+        player.__dict__.pop(name, None)
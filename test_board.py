@@ -0,0 +1,56 @@
+# Tests of the board backends
+#
+# Run with: python -m pytest -q  (or python -m unittest test_board)
+import random
+import unittest
+
+from bitboard import BitBoard
+from gomoku import Board
+
+
+class BitBoardTest(unittest.TestCase):
+
+    def assertSame(self, board, bits):
+        self.assertEqual(bits.slots, board.slots)
+        self.assertEqual(bits.history, board.history)
+        self.assertEqual(bits.frontier, board.frontier)
+        self.assertEqual(bits.hash, board.hash)
+        self.assertEqual(bits.is_full(), board.is_full())
+
+    def test_random_games(self):
+        rng = random.Random(0)
+        for game in range(40):
+            height, width = rng.choice([(5, 5), (10, 10), (7, 12), (15, 15)])
+            board = Board(height, width)
+            bits = BitBoard(height, width)
+            checker = 'X'
+            while not board.is_full():
+                row, col = rng.randrange(height), rng.randrange(width)
+                if not board.can_add_to(row, col):
+                    self.assertFalse(bits.can_add_to(row, col))
+                    continue
+                board.add_checker(checker, row, col)
+                bits.add_checker(checker, row, col)
+                for ch in 'XO':
+                    self.assertEqual(bits.is_win_for(ch, row, col),
+                                     board.is_win_for(ch, row, col))
+                self.assertSame(board, bits)
+                # now and then, take a few moves back
+                if rng.random() < 0.1:
+                    for i in range(rng.randint(1, min(3, len(board.history)))):
+                        self.assertEqual(bits.undo(), board.undo())
+                        self.assertSame(board, bits)
+                if board.is_win_for(checker, row, col):
+                    break
+                checker = 'O' if checker == 'X' else 'X'
+            self.assertSame(board, bits)
+
+    def test_from_board(self):
+        board = Board(10, 10)
+        for checker, row, col in (('X', 4, 4), ('O', 4, 5), ('X', 5, 5), ('O', 6, 6)):
+            board.add_checker(checker, row, col)
+        self.assertSame(board, BitBoard.from_board(board))
+
+
+if __name__ == '__main__':
+    unittest.main()
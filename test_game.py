@@ -0,0 +1,52 @@
+# Tests of playing whole games
+#
+# Run with: python -m pytest -q  (or python -m unittest test_game)
+import unittest
+
+from gomoku import RandomPlayer
+from main import AIPlayer
+from match import play_game
+from process import gomoku
+
+
+class ClockTest(unittest.TestCase):
+
+    def players(self):
+        return (AIPlayer('X', time_limit=0.05, max_depth=1, seed=0, threat_depth=0),
+                RandomPlayer('O', seed=1))
+
+    def test_untimed_game_after_timed_one(self):
+        p1, p2 = self.players()
+        # no time at all: 'X' loses on time before its first move
+        board = gomoku(p1, p2, verbose=False, clock=(0.0, 0.0))
+        self.assertEqual(len(board.history), 0)
+        self.assertTrue(p1.clock.flagged)
+        board = gomoku(p1, p2, verbose=False)
+        self.assertIsNone(p1.clock)
+        self.assertIsNone(p2.clock)
+        self.assertIsNone(p1.time_manager)
+        self.assertGreater(len(board.history), 0)
+        last = board.last_move()
+        self.assertTrue(board.is_full() or board.is_win_for(last[0], last[1], last[2]))
+
+    def test_untimed_match_game_after_timed_one(self):
+        p1, p2 = self.players()
+        winner, board, latencies = play_game(p1, p2, clock=(0.0, 0.0))
+        self.assertEqual((winner, len(board.history)), ('O', 0))
+        winner, board, latencies = play_game(p1, p2)
+        self.assertIsNone(p1.clock)
+        self.assertGreater(len(board.history), 0)
+
+
+class PonderTest(unittest.TestCase):
+
+    def test_pondering_stops_with_the_game(self):
+        for play in (lambda p1, p2: gomoku(p1, p2, verbose=False), play_game):
+            p1 = AIPlayer('X', time_limit=0.05, max_depth=1, seed=0, threat_depth=0, ponder=True)
+            p2 = RandomPlayer('O', seed=1)
+            play(p1, p2)
+            self.assertIsNone(p1.ponder_thread)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# Tests of the AI player's search
+#
+# Run with: python -m pytest -q  (or python -m unittest test_search)
+import math
+import unittest
+
+from bench import POSITIONS, build_board
+from gomoku import Board, zobrist_keys
+from main import AIPlayer
+from transposition import TranspositionTable, last_move_keys
+
+
+class NoTable(TranspositionTable):
+    """ a transposition table that never holds anything.
+    """
+
+    def probe(self, key):
+        return None
+
+    def store(self, *args):
+        pass
+
+
+def root_scores(player, board, open_pos, depth):
+    player.start_search()
+    player.deadline = math.inf
+    player.nodes = 0
+    return player.search_root(board, open_pos, depth)
+
+
+class TranspositionTest(unittest.TestCase):
+
+    def test_last_move_keys_differ_from_zobrist_keys(self):
+        for size in (10, 15, 19):
+            keys = last_move_keys(size, size)
+            zobrist = zobrist_keys(size, size)
+            self.assertNotEqual(keys, zobrist['X'])
+            self.assertNotEqual(keys, zobrist['O'])
+
+    def test_table_does_not_change_scores(self):
+        # each root move is searched alone, with a full window, so its score
+        # is exact with or without the table
+        cases = [(Board(10, 10), 'X', [(3, 3), (5, 5), (4, 5)])]
+        for name in ('reply-10', 'middle-10', 'defend-three-10'):
+            position = [p for p in POSITIONS if p[0] == name][0]
+            board, checker = build_board(position[2], position[3])
+            cases.append((board, checker, sorted(board.frontier)[:6]))
+        for board, checker, moves in cases:
+            for depth in (1, 2):
+                with_table = AIPlayer(checker, threat_depth=0)
+                without = AIPlayer(checker, threat_depth=0)
+                without.tt = NoTable(1)
+                for move in moves:
+                    self.assertEqual(root_scores(with_table, board, [move], depth),
+                                     root_scores(without, board, [move], depth))
+                # searched together, the best score is the same too
+                self.assertEqual(max(root_scores(AIPlayer(checker, threat_depth=0),
+                                                 board, moves, depth).values()),
+                                 max(root_scores(without, board, moves, depth).values()))
+
+
+class MinimaxTest(unittest.TestCase):
+
+    def four_of_x(self):
+        # 'X' wins at (5, 6) whatever 'O' plays elsewhere
+        board = Board(10, 10)
+        for col in range(2, 6):
+            board.add_checker('X', 5, col)
+        for row, col in ((5, 1), (0, 0), (9, 9), (0, 9)):
+            board.add_checker('O', row, col)
+        return board
+
+    def test_opponent_replies_are_minimized(self):
+        player = AIPlayer('O', threat_depth=0)
+        scores = root_scores(player, self.four_of_x(), [(3, 3), (5, 6)], 2)
+        self.assertEqual(scores[(3, 3)], -100000)
+        self.assertGreater(scores[(5, 6)], -100000)
+
+    def test_principal_variation_predicts_the_best_reply(self):
+        player = AIPlayer('O', threat_depth=0)
+        board = self.four_of_x()
+        root_scores(player, board, [(3, 3)], 2)
+        self.assertEqual(player.principal_variation(board, (3, 3))[0], [(3, 3), (5, 6)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,234 @@
+# Threat-space search for the AI player
+#
+# Looks for forced wins made only of threats: fours, which must be blocked
+# at once (VCF, victory by continuous fours), and optionally open threes,
+# which must be answered before they become open fours (VCT, victory by
+# continuous threats). Only those moves are searched, so the search can go
+# much deeper than the full minimax. The shapes are the ones static_eval
+# scores: a four is a 5-cell window with four checkers and an empty slot, an
+# open three a 6-cell window ' ooo  ', '  ooo ', ' oo o ' or ' o oo '.
+import functools
+import time
+
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+class ThreatTimeout(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def _cell_windows(height, width, length):
+    """ returns, for every cell of a board of the given size, the list of
+        windows of the given length (tuples of cells along one of the four
+        directions) that contain it, inside the board.
+    """
+    windows = [[[] for col in range(width)] for row in range(height)]
+    for dr, dc in DIRECTIONS:
+        for row in range(height):
+            for col in range(width):
+                end_row = row + dr * (length - 1)
+                end_col = col + dc * (length - 1)
+                if not (0 <= end_row < height and 0 <= end_col < width):
+                    continue
+                cells = tuple((row + dr * k, col + dc * k) for k in range(length))
+                for r, c in cells:
+                    windows[r][c].append(cells)
+    return windows
+
+
+def threat_moves(board, checker, threes=False):
+    """ returns three sets of empty cells where checker can move to make a
+        five, to make a four and (if threes is True) to make an open three.
+    """
+    fives, fours, open_threes = set(), set(), set()
+    seen = set()
+    slots = board.slots
+    windows5 = _cell_windows(board.height, board.width, 5)
+    windows6 = _cell_windows(board.height, board.width, 6)
+    for ch, row, col in board.history:
+        if ch != checker:
+            continue
+        for cells in windows5[row][col]:
+            if cells in seen:
+                continue
+            seen.add(cells)
+            empty = [(r, c) for r, c in cells if slots[r][c] == ' ']
+            own = sum(1 for r, c in cells if slots[r][c] == checker)
+            if own + len(empty) != 5:
+                continue
+            if own == 4:
+                fives.update(empty)
+            elif own == 3:
+                fours.update(empty)
+        if threes:
+            for cells in windows6[row][col]:
+                # open threes: the stone is inside, the two ends are empty
+                if cells in seen or (row, col) in (cells[0], cells[5]) \
+                        or slots[cells[0][0]][cells[0][1]] != ' ' \
+                        or slots[cells[5][0]][cells[5][1]] != ' ':
+                    continue
+                seen.add(cells)
+                inner = cells[1:5]
+                empty = [(r, c) for r, c in inner if slots[r][c] == ' ']
+                own = sum(1 for r, c in inner if slots[r][c] == checker)
+                if own == 2 and len(empty) == 2:
+                    open_threes.update(empty)
+    return fives, fours, open_threes
+
+
+def threats_through(board, checker, row, col):
+    """ returns the threats made by the checker at (row, col): the set of
+        cells completing a five through it (the gains of its fours) and the
+        set of cells that defend against the open threes through it.
+    """
+    gains, defences = set(), set()
+    slots = board.slots
+    for cells in _cell_windows(board.height, board.width, 5)[row][col]:
+        empty = [(r, c) for r, c in cells if slots[r][c] == ' ']
+        own = sum(1 for r, c in cells if slots[r][c] == checker)
+        if own == 4 and len(empty) == 1:
+            gains.add(empty[0])
+    for cells in _cell_windows(board.height, board.width, 6)[row][col]:
+        if (row, col) in (cells[0], cells[5]) \
+                or slots[cells[0][0]][cells[0][1]] != ' ' \
+                or slots[cells[5][0]][cells[5][1]] != ' ':
+            continue
+        inner = cells[1:5]
+        empty = [(r, c) for r, c in inner if slots[r][c] == ' ']
+        own = sum(1 for r, c in inner if slots[r][c] == checker)
+        if own == 3 and len(empty) == 1:
+            defences.update((cells[0], cells[5], empty[0]))
+    return gains, defences
+
+
+class ThreatSolver:
+    """ searches forced wins for one side on a board, which is modified
+    during the search and restored afterwards. max_depth is the number of
+    threats the attacker may play, threes allows open threes besides fours
+    and deadline (a time.time() value) bounds the search.
+    """
+
+    def __init__(self, max_depth=10, threes=False, deadline=None):
+        self.max_depth = max_depth
+        self.threes = threes
+        self.deadline = deadline
+        self.nodes = 0
+        self.failed = {}
+
+    def solve(self, board, checker):
+        """ returns a forced win for checker, moving first on board, as the
+            list of moves [attack, defence, attack, ..., winning move], or
+            None if none was found within the depth and the time allowed.
+        """
+        try:
+            # deepening one threat at a time finds the shortest wins first
+            for depth in range(1, self.max_depth + 1):
+                line = self.attack(board, checker, depth)
+                if line is not None:
+                    return line
+        except ThreatTimeout:
+            pass
+        return None
+
+    def attack(self, board, checker, depth):
+        opp_checker = 'O' if checker == 'X' else 'X'
+        fives, fours, open_threes = threat_moves(board, checker, self.threes)
+        if fives:
+            return [min(fives)]
+        if depth == 0:
+            return None
+        if self.failed.get(board.hash, -1) >= depth:
+            return None
+        self.nodes += 1
+        # a node costs much more than reading the clock, and ever more
+        # with the number of checkers on large boards
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise ThreatTimeout()
+
+        opp_fives, opp_fours, _ = threat_moves(board, opp_checker)
+        if len(opp_fives) >= 2:
+            return None
+        # fours first: they leave the defender a single reply
+        candidates = sorted(fours) + sorted(open_threes - fours)
+        if opp_fives:
+            candidates = [move for move in candidates if move in opp_fives]
+
+        for move in candidates:
+            board.add_checker(checker, move[0], move[1])
+            try:
+                gains, defences = threats_through(board, checker, move[0], move[1])
+                if gains:
+                    replies = gains
+                elif defences:
+                    # against a three the defender may also counter with a four
+                    replies = defences | opp_fours | opp_fives
+                else:
+                    replies = None
+                line = None
+                if replies is not None and not (opp_fives - {move}):
+                    line = self.defend(board, checker, opp_checker, sorted(replies), depth)
+            finally:
+                # also on a timeout, so that the board is given back intact
+                board.undo()
+            if line is not None:
+                return [move] + line
+        self.failed[board.hash] = depth
+        return None
+
+    def defend(self, board, checker, opp_checker, replies, depth):
+        """ returns the attacker's forced line against the first reply, if
+            every reply loses, or None if one of them holds.
+        """
+        first_line = None
+        for reply in replies:
+            if not board.can_add_to(reply[0], reply[1]):
+                continue
+            board.add_checker(opp_checker, reply[0], reply[1])
+            try:
+                if board.is_win_for(opp_checker, reply[0], reply[1]):
+                    line = None
+                else:
+                    line = self.attack(board, checker, depth - 1)
+            finally:
+                board.undo()
+            if line is None:
+                return None
+            if first_line is None:
+                first_line = [reply] + line
+        return first_line
+
+
+def find_win(board, checker, max_depth=10, deadline=None):
+    """ returns a forced win for checker moving first on board, trying
+        continuous fours first and then fours and open threes, or None.
+    """
+    for threes in (False, True):
+        line = ThreatSolver(max_depth, threes, deadline).solve(board, checker)
+        if line is not None:
+            return line
+        if deadline is not None and time.time() >= deadline:
+            break
+    return None
+
+
+def find_defences(board, checker, line, max_depth=10, deadline=None):
+    """ given line, a forced win of the opponent of checker if the opponent
+        were to move, returns the cells of line where checker can move to
+        stop every forced win the opponent would have left.
+    """
+    opp_checker = 'O' if checker == 'X' else 'X'
+    defences = []
+    for move in line:
+        if move in defences or not board.can_add_to(move[0], move[1]):
+            continue
+        board.add_checker(checker, move[0], move[1])
+        holds = board.is_win_for(checker, move[0], move[1]) or \
+            find_win(board, opp_checker, max_depth, deadline) is None
+        board.undo()
+        if deadline is not None and time.time() >= deadline:
+            # the last answer may have been cut short
+            break
+        if holds:
+            defences.append(move)
+    return defences
@@ -0,0 +1,148 @@
+# Time control for the AI player
+#
+# A GameClock is the clock of one player for a whole game: base seconds at
+# the start, plus an increment after every move. The game runs it (see
+# process.gomoku): it is started when the player is asked for a move and
+# stopped when the move is played, and the player whose time runs out loses.
+#
+# The TimeManager of an AIPlayer shares the time left out between the
+# moves. Every move gets two limits: a soft one, the time it is expected
+# to use, after which no new depth of the iterative deepening is started,
+# and a hard one, at which the search is stopped whatever its state. The
+# soft limit is the time left per move still to play, shortened in the
+# opening and in forcing positions and lengthened while the best move keeps
+# changing from one depth to the next; the hard limit always leaves a
+# safety margin on the clock.
+import time
+
+
+class GameClock:
+    """ the clock of one player: base seconds for the game and increment
+    seconds added after every move. remaining is the time left, not
+    counting the move being played, and flagged tells if it ran out.
+    """
+
+    def __init__(self, base, increment=0.0):
+        self.base = base
+        self.increment = increment
+        self.remaining = base
+        self.started = None
+        self.flagged = False
+
+    def start(self):
+        """ starts counting the time of a move.
+        """
+        self.started = time.time()
+
+    def stop(self):
+        """ stops counting the time of a move, adds the increment and
+            returns the seconds the move took.
+        """
+        seconds = time.time() - self.started
+        self.started = None
+        self.remaining -= seconds
+        if self.remaining < 0:
+            self.flagged = True
+        else:
+            self.remaining += self.increment
+        return seconds
+
+    def time_left(self):
+        """ returns the time left now, the move being played included.
+        """
+        if self.started is None:
+            return self.remaining
+        return self.remaining - (time.time() - self.started)
+
+    def __repr__(self):
+        return '%.1fs' % max(0.0, self.time_left())
+
+
+def set_clocks(players, clock):
+    """ gives every player a new GameClock for a game, clock being (base,
+        increment) in seconds, or no clock at all if clock is None. The
+        time managers of the players are reset with it.
+    """
+    for player in players:
+        player.clock = None if clock is None else GameClock(*clock)
+        if hasattr(player, 'time_manager'):
+            player.time_manager = None
+
+
+class TimeManager:
+    """ shares the time of a GameClock out between the moves of a player.
+    allocate() sets the limits of a move, forcing() shortens them in a
+    forcing position and stop_after() tells after every completed depth if
+    the search should stop there.
+    """
+
+    #Moves a game is expected to last for a player, and the fewest moves
+    #the time left is ever shared between
+    EXPECTED_MOVES = 30
+    MIN_MOVES_TO_GO = 8
+    #Share of the soft limit used by the first moves, searched on a small
+    #window, and by forcing positions (a defence, or few candidates)
+    OPENING_SHARE = 0.4
+    FORCING_SHARE = 0.3
+    #The hard limit is at most this many soft limits, and this share of
+    #the time left once the safety margin is taken off
+    HARD_FACTOR = 4.0
+    HARD_SHARE = 0.3
+    SAFETY_MARGIN = 0.1
+    #No new depth is started past this share of the soft limit, which is
+    #lengthened when the best move changed at the last depth and shortened
+    #when it has not changed for STABLE_DEPTHS depths
+    START_SHARE = 0.5
+    UNSTABLE_FACTOR = 2.0
+    STABLE_FACTOR = 0.6
+    STABLE_DEPTHS = 3
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.soft = 0.0
+        self.hard = 0.0
+        self.best = None
+        self.stable = 0
+
+    def allocate(self, board, num_moves):
+        """ sets the limits of the move number num_moves (counted from 1)
+            of the player on board, and returns (soft, hard) in seconds.
+        """
+        time_left = max(0.0, self.clock.time_left() - self.SAFETY_MARGIN)
+        empty = board.height * board.width - len(board.history)
+        moves_to_go = max(self.MIN_MOVES_TO_GO,
+                          min(self.EXPECTED_MOVES - num_moves, (empty + 1) // 2))
+        soft = time_left / moves_to_go + self.clock.increment
+        if num_moves <= 2:
+            soft *= self.OPENING_SHARE
+        self.hard = min(soft * self.HARD_FACTOR, time_left * self.HARD_SHARE)
+        self.soft = min(soft, self.hard)
+        self.best = None
+        self.stable = 0
+        return self.soft, self.hard
+
+    def forcing(self, candidates, defence=False):
+        """ shortens the limits of a move which defends against a forced
+            win or has few candidates left.
+        """
+        if defence or candidates <= 3:
+            self.soft *= self.FORCING_SHARE
+            self.hard = min(self.hard, self.soft * self.HARD_FACTOR)
+
+    def stop_after(self, elapsed, move):
+        """ returns True if the search should not start a new depth, after
+            one completed at elapsed seconds with move as the best move.
+        """
+        if move == self.best:
+            self.stable += 1
+            changed = False
+        else:
+            changed = self.best is not None
+            self.best = move
+            self.stable = 0
+        limit = self.soft
+        if changed:
+            limit *= self.UNSTABLE_FACTOR
+        elif self.stable >= self.STABLE_DEPTHS:
+            limit *= self.STABLE_FACTOR
+        return elapsed >= min(limit, self.hard) * self.START_SHARE
@@ -0,0 +1,84 @@
+# A bounded transposition table for the AI player's search
+#
+# Positions are looked up by their Zobrist key. The table has a fixed number
+# of slots derived from a memory cap and keeps its content between searches,
+# so that the work of one move is reused on the next ones.
+import functools
+import random
+
+EXACT = 0
+LOWER = 1   # the stored score is a lower bound of the real one
+UPPER = 2   # the stored score is an upper bound of the real one
+
+
+@functools.lru_cache(maxsize=None)
+def last_move_keys(height, width):
+    """ returns one random 64-bit key per position of the board, used to
+        tell apart the same position reached through different last moves.
+        They are drawn from their own string seed: an integer seed such as
+        -(height * 1000 + width) gives the same stream as the Zobrist keys
+        of gomoku.zobrist_keys, which would cancel the checkers of 'X'.
+    """
+    rng = random.Random('last move %dx%d' % (height, width))
+    return [[rng.getrandbits(64) for col in range(width)]
+            for row in range(height)]
+
+
+class TranspositionTable:
+    """ a fixed-size hash table of search results. Every entry is a tuple
+    (key, depth, flag, score, move, generation). A slot is overwritten by a
+    new result when it is empty, was written during an older search or was
+    searched to a lower or equal depth.
+    """
+
+    # rough size of one entry (slot + tuple + integers) in bytes
+    ENTRY_BYTES = 160
+
+    def __init__(self, size_mb=16):
+        size = 1
+        while size * 2 * self.ENTRY_BYTES <= size_mb * 2**20:
+            size *= 2
+        self.size = size
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.generation = 0
+        self.hits = 0
+        self.stores = 0
+
+    def __len__(self):
+        return sum(1 for entry in self.entries if entry is not None)
+
+    def new_search(self):
+        """ starts a new search: entries from the previous ones are kept,
+            but are replaced first.
+        """
+        self.generation += 1
+
+    def retain(self, keys):
+        """ moves the entries of keys that are still stored to the current
+            search, so that they are not replaced before the older ones.
+        """
+        for key in keys:
+            idx = key & self.mask
+            entry = self.entries[idx]
+            if entry is not None and entry[0] == key:
+                self.entries[idx] = entry[:5] + (self.generation,)
+
+    def clear(self):
+        self.entries = [None] * self.size
+
+    def probe(self, key):
+        """ returns the entry stored for key, or None.
+        """
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        idx = key & self.mask
+        entry = self.entries[idx]
+        if entry is None or entry[5] != self.generation or depth >= entry[1]:
+            self.entries[idx] = (key, depth, flag, score, move, self.generation)
+            self.stores += 1
@@ -0,0 +1,304 @@
+# Tuning of the evaluation weights
+#
+# A pipeline of three steps working in one directory, each of which can be
+# stopped and run again to carry on where it was:
+#   selfplay  plays games between AIPlayers on all the cores, each one from
+#             a few random opening moves, and appends them to
+#             DIR/games.rec (see records.py)
+#   features  replays the games on all the cores and stores, for every
+#             position, the pattern counts of batch_eval.pattern_counts
+#             and the result of the game (1 won, 0.5 drawn, 0 lost), both
+#             from the point of view of the player who has just moved, as
+#             the search evaluates its leaves, in DIR/features.npz
+#   fit       fits the weights to the results with Texel's method: the
+#             result is predicted as sigmoid(static_eval / scale), scale
+#             being fitted first to the current weights, and the mean
+#             squared error is minimised by Adam over minibatches, on the
+#             whole array at once. Progress is saved to DIR/checkpoint.json
+#             after every epoch and the weights to DIR/weights.json.
+# The weights found are used with AIPlayer('O', weights='DIR/weights.json'),
+# and can be played in turn to generate the next games (selfplay --weights).
+#
+# Usage: python tune.py selfplay DIR [--games N] [--size N] [--time-limit S]
+#                                    [--max-depth N] [--random-plies N]
+#                                    [--weights FILE] [--workers N]
+#        python tune.py features DIR [--skip-plies N] [--workers N]
+#        python tune.py fit DIR [--epochs N] [--batch N] [--lr F]
+#                               [--weights FILE] [--restart]
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+import numpy as np
+
+from batch_eval import pattern_counts
+from evaluation import WEIGHT_NAMES, load_weights, save_weights, weights_vector
+from gomoku import Board
+from main import AIPlayer
+from records import RecordReader, RecordWriter, bounded_imap
+
+GAMES_FILE = 'games.rec'
+FEATURES_FILE = 'features.npz'
+CHECKPOINT_FILE = 'checkpoint.json'
+WEIGHTS_FILE = 'weights.json'
+# games handed to a worker at a time
+GAMES_PER_TASK = 64
+
+
+def _selfplay_game(task):
+    """ plays one self-play game in a worker process and returns its moves
+        and winner ('X', 'O', or None for a draw).
+    """
+    index, seed, size, time_limit, max_depth, random_plies, weights = task
+    rng = random.Random(seed * 1000003 + index)
+    board = Board(size, size)
+    checker = 'X'
+    # a few random moves near the centre, then near the checkers
+    centre = size // 2
+    for ply in range(random_plies):
+        if board.frontier:
+            row, col = rng.choice(sorted(board.frontier))
+        else:
+            row, col = centre + rng.randint(-2, 2), centre + rng.randint(-2, 2)
+        board.add_checker(checker, row, col)
+        if board.is_win_for(checker, row, col):
+            return [(r, c) for ch, r, c in board.history], checker
+        checker = 'O' if checker == 'X' else 'X'
+    players = {ch: AIPlayer(ch, time_limit=time_limit, max_depth=max_depth,
+                            seed=rng.getrandbits(32), weights=weights)
+               for ch in 'XO'}
+    winner = None
+    try:
+        while not board.is_full():
+            player = players[checker]
+            player.num_moves = sum(1 for ch, r, c in board.history if ch == checker)
+            row, col = player.next_move(board)
+            board.add_checker(checker, row, col)
+            if board.is_win_for(checker, row, col):
+                winner = checker
+                break
+            checker = 'O' if checker == 'X' else 'X'
+    finally:
+        for player in players.values():
+            player.close()
+    return [(r, c) for ch, r, c in board.history], winner
+
+
+def selfplay(directory, games=1000, size=10, time_limit=0.1, max_depth=3,
+             random_plies=4, weights=None, workers=None, seed=0):
+    """ plays self-play games until DIR/games.rec holds games games, on a
+        pool of workers processes (all the cores by default). The games
+        are written in order, each one as soon as it and the ones before it
+        are over, so that a run interrupted and started again carries on
+        with the first game missing from the file.
+    """
+    path = os.path.join(directory, GAMES_FILE)
+    done = 0
+    if os.path.exists(path):
+        with RecordReader(path) as reader:
+            done = sum(1 for record in reader)
+    tasks = [(index, seed, size, time_limit, max_depth, random_plies, weights)
+             for index in range(done, games)]
+    start = time.time()
+    with RecordWriter(path, size, size) as writer, multiprocessing.Pool(workers) as pool:
+        for count, (moves, winner) in enumerate(pool.imap(_selfplay_game, tasks), 1):
+            writer.write(moves, winner)
+            writer.flush()
+            if count % 100 == 0 or count == len(tasks):
+                print('%d games, %.1f games/s' % (done + count, count / (time.time() - start)))
+
+
+def _game_features(task):
+    """ returns the pattern counts and the results of the positions of a
+        list of games, from the point of view of the player who has just
+        moved, and the number of games.
+    """
+    records, height, width, skip_plies = task
+    boards = []
+    movers = []
+    results = []
+    for record in records:
+        if record.result == '?':
+            continue
+        cells = np.zeros((height, width), dtype=np.int8)
+        checker = record.first
+        # the last position is over and left out
+        for ply, (row, col) in enumerate(record.moves[:-1]):
+            cells[row, col] = 1 if checker == 'X' else 2
+            if ply + 1 >= skip_plies:
+                boards.append(cells.copy())
+                movers.append(checker)
+                results.append(0.5 if record.result is None else
+                               float(record.result == checker))
+            checker = 'O' if checker == 'X' else 'X'
+    features = np.zeros((len(boards), len(WEIGHT_NAMES)), dtype=np.int16)
+    if boards:
+        boards = np.array(boards)
+        movers = np.array(movers)
+        for checker in 'XO':
+            mask = movers == checker
+            if mask.any():
+                features[mask] = pattern_counts(boards[mask], checker)
+    return features, np.array(results, dtype=np.float32), len(records)
+
+
+def features(directory, skip_plies=4, workers=None):
+    """ computes the features of the games of DIR/games.rec not yet in
+        DIR/features.npz and adds them to it.
+    """
+    path = os.path.join(directory, FEATURES_FILE)
+    x_parts = []
+    y_parts = []
+    done = 0
+    if os.path.exists(path):
+        data = np.load(path)
+        x_parts.append(data['x'])
+        y_parts.append(data['y'])
+        done = int(data['games'])
+    games = 0
+    with RecordReader(os.path.join(directory, GAMES_FILE)) as reader, \
+            multiprocessing.Pool(workers) as pool:
+        def tasks():
+            chunk = []
+            for index, record in enumerate(reader):
+                if index >= done:
+                    chunk.append(record)
+                if len(chunk) == GAMES_PER_TASK:
+                    yield chunk, reader.height, reader.width, skip_plies
+                    chunk = []
+            if chunk:
+                yield chunk, reader.height, reader.width, skip_plies
+
+        for x, y, count in bounded_imap(pool, _game_features, tasks(), 4 * (workers or os.cpu_count())):
+            x_parts.append(x)
+            y_parts.append(y)
+            games += count
+    x = np.concatenate(x_parts) if x_parts else np.zeros((0, len(WEIGHT_NAMES)), dtype=np.int16)
+    y = np.concatenate(y_parts) if y_parts else np.zeros(0, dtype=np.float32)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, x=x, y=y, games=done + games, names=np.array(WEIGHT_NAMES))
+    os.replace(tmp, path)
+    print('%d games, %d positions' % (done + games, len(y)))
+
+
+def _sigmoid(e):
+    return 1.0 / (1.0 + np.exp(-np.clip(e, -50.0, 50.0)))
+
+
+def texel_loss(x, y, weights, scale):
+    """ returns the mean squared error of the results y predicted from the
+        pattern counts x with weights.
+    """
+    return float(np.mean((_sigmoid(x @ weights / scale) - y) ** 2))
+
+
+def fit_scale(x, y, weights):
+    """ returns the scale that best predicts y from the evaluation with
+        weights, searched on a logarithmic grid refined around its best
+        point.
+    """
+    scales = np.logspace(0, 6, 61)
+    for i in range(3):
+        losses = [texel_loss(x, y, weights, s) for s in scales]
+        best = int(np.argmin(losses))
+        lo = scales[max(0, best - 1)]
+        hi = scales[min(len(scales) - 1, best + 1)]
+        scales = np.linspace(lo, hi, 21)
+    return float(scales[int(np.argmin([texel_loss(x, y, weights, s) for s in scales]))])
+
+
+def _save_checkpoint(path, state):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+
+def fit(directory, epochs=20, batch=65536, lr=0.01, weights=None, restart=False, seed=0):
+    """ fits the weights to the positions of DIR/features.npz, starting
+        from weights (the default ones if None) or from DIR/checkpoint.json
+        unless restart is True, and writes them to DIR/weights.json. lr is
+        the step of Adam, relative to the size of every starting weight.
+    """
+    data = np.load(os.path.join(directory, FEATURES_FILE))
+    if list(data['names']) != WEIGHT_NAMES:
+        raise ValueError('the features were computed for other weights')
+    x = data['x'].astype(np.float64)
+    y = data['y'].astype(np.float64)
+    checkpoint = os.path.join(directory, CHECKPOINT_FILE)
+    if os.path.exists(checkpoint) and not restart:
+        with open(checkpoint) as f:
+            state = json.load(f)
+        print('resuming from epoch', state['epoch'])
+    else:
+        start = np.array(weights_vector(weights), dtype=np.float64)
+        state = {'epoch': 0, 'weights': start.tolist(), 'start': start.tolist(),
+                 'scale': fit_scale(x, y, start), 'm': [0.0] * len(start),
+                 'v': [0.0] * len(start), 'steps': 0}
+        state['loss'] = texel_loss(x, y, start, state['scale'])
+        print('scale %.1f, loss %.6f' % (state['scale'], state['loss']))
+    w = np.array(state['weights'])
+    m = np.array(state['m'])
+    v = np.array(state['v'])
+    steps = state['steps']
+    scale = state['scale']
+    # every weight moves in proportion to its starting size
+    step = lr * np.maximum(np.abs(np.array(state['start'])), 10.0)
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    for epoch in range(state['epoch'], epochs):
+        # the order depends on the epoch only, so a resumed run is the same
+        order = np.random.default_rng(seed + epoch).permutation(len(y))
+        for i in range(0, len(y), batch):
+            idx = order[i:i + batch]
+            xb = x[idx]
+            p = _sigmoid(xb @ w / scale)
+            grad = xb.T @ (2.0 * (p - y[idx]) * p * (1.0 - p)) / (scale * len(idx))
+            steps += 1
+            m = beta1 * m + (1 - beta1) * grad
+            v = beta2 * v + (1 - beta2) * grad ** 2
+            m_hat = m / (1 - beta1 ** steps)
+            v_hat = v / (1 - beta2 ** steps)
+            w -= step * m_hat / (np.sqrt(v_hat) + eps)
+        loss = texel_loss(x, y, w, scale)
+        state.update(epoch=epoch + 1, weights=w.tolist(), m=m.tolist(), v=v.tolist(),
+                     steps=steps, loss=loss)
+        _save_checkpoint(checkpoint, state)
+        save_weights(os.path.join(directory, WEIGHTS_FILE), w)
+        print('epoch %d: loss %.6f' % (epoch + 1, loss))
+    for name, value in zip(WEIGHT_NAMES, weights_vector(w)):
+        print('%-16s %8d' % (name, value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tune the evaluation weights by self-play.')
+    parser.add_argument('command', choices=['selfplay', 'features', 'fit'])
+    parser.add_argument('directory')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--size', type=int, default=10)
+    parser.add_argument('--time-limit', type=float, default=0.1)
+    parser.add_argument('--max-depth', type=int, default=3)
+    parser.add_argument('--random-plies', type=int, default=4)
+    parser.add_argument('--skip-plies', type=int, default=4)
+    parser.add_argument('--weights', default=None, help='JSON file of weights to start from')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=65536)
+    parser.add_argument('--lr', type=float, default=0.01)
+    parser.add_argument('--restart', action='store_true', help='fit from scratch')
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    weights = load_weights(args.weights) if args.weights else None
+    if args.command == 'selfplay':
+        selfplay(args.directory, args.games, args.size, args.time_limit, args.max_depth,
+                 args.random_plies, weights, args.workers, args.seed)
+    elif args.command == 'features':
+        features(args.directory, args.skip_plies, args.workers)
+    else:
+        fit(args.directory, args.epochs, args.batch, args.lr, weights, args.restart, args.seed)
+
+
+if __name__ == '__main__':
+    main()